@@ -1,16 +1,40 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (
+    Flask, Response, g, request, jsonify, make_response, send_file, send_from_directory,
+    stream_with_context,
+)
 from flask_cors import CORS
 from flask_pymongo import PyMongo
-import uuid
 from datetime import datetime
-from keras.models import load_model
-from PIL import Image, ImageOps
+from PIL import Image
 import numpy as np
 import os
-import google.genai as genai
+import mimetypes
+import time
+import functools
+import cProfile
+import pstats
+import json
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from io import BytesIO
-from werkzeug.utils import secure_filename
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+from batcher import BatchingPredictor, QueueFullError
+from result_cache import LRUCache, ResultCache, file_digest
+from captioning import (
+    CaptionService, CaptionUnavailableError, CircuitBreaker, GeminiCaptioner,
+    JobStore, StubCaptioner, gemini_image,
+)
+from preprocessing import BufferPool, fit, normalize_into, open_image, preprocess
+from bulk import BulkUploadError, SkippedUpload, ZIP_TYPES, iter_uploads
+from inference_backends import load_backend
+from model_loader import ModelLoader
+from history import BUCKET_FORMATS, HistoryWriter, ensure_history_indexes, history_page, history_stats
+from upload_store import CONTENT_NAME, UploadStore, extension_for, thumbnail_name
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
 
 # Load environment variables
 load_dotenv(".env")
@@ -19,12 +43,182 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # --- 1. Environment Configuration ---
 UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER")
 FILE_SERVER_BASE_URL = os.environ.get("FILE_SERVER_BASE_URL")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras")  # keras, tflite-float, tflite-int8
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "0")) or None
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5"))
+INFERENCE_QUEUE_DEPTH = int(os.environ.get("INFERENCE_QUEUE_DEPTH", "256"))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+CAPTION_BACKEND = os.environ.get("CAPTION_BACKEND", "gemini")  # "gemini" or "stub"
+CAPTION_WORKERS = int(os.environ.get("CAPTION_WORKERS", "4"))
+CAPTION_MAX_PENDING = int(os.environ.get("CAPTION_MAX_PENDING", "16"))
+CAPTION_TIMEOUT_SECONDS = float(os.environ.get("CAPTION_TIMEOUT_SECONDS", "20"))
+CAPTION_BREAKER_FAILURES = int(os.environ.get("CAPTION_BREAKER_FAILURES", "5"))
+CAPTION_BREAKER_RESET_SECONDS = float(os.environ.get("CAPTION_BREAKER_RESET_SECONDS", "30"))
+CAPTION_STUB_DELAY_MS = float(os.environ.get("CAPTION_STUB_DELAY_MS", "0"))
+PREPROCESS_RESAMPLING = os.environ.get("PREPROCESS_RESAMPLING", "lanczos")
+PREPROCESS_JPEG_DRAFT = os.environ.get("PREPROCESS_JPEG_DRAFT", "1") == "1"
+PREPROCESS_BUFFERS = int(os.environ.get("PREPROCESS_BUFFERS", "32"))
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", "32"))
+# Fixed batch sizes the TFLite backends run at (a batch is padded up to one).
+INFERENCE_BATCH_BUCKETS = sorted({int(n) for n in os.environ.get(
+    "INFERENCE_BATCH_BUCKETS", f"1,4,{INFERENCE_BATCH_SIZE},{BULK_BATCH_SIZE}").split(",")})
+BULK_DECODE_THREADS = int(os.environ.get("BULK_DECODE_THREADS", "4"))
+BULK_MAX_FILE_BYTES = int(os.environ.get("BULK_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+# Caption calls all bulk uploads together may have pending; the rest of
+# CAPTION_MAX_PENDING stays free for interactive requests.
+BULK_CAPTION_WINDOW = int(os.environ.get("BULK_CAPTION_WINDOW", str(max(1, CAPTION_MAX_PENDING // 2))))
+MODEL_LOAD_WAIT_SECONDS = float(os.environ.get("MODEL_LOAD_WAIT_SECONDS", "30"))
+HISTORY_FLUSH_BATCH = int(os.environ.get("HISTORY_FLUSH_BATCH", "100"))
+HISTORY_FLUSH_INTERVAL_MS = float(os.environ.get("HISTORY_FLUSH_INTERVAL_MS", "500"))
+HISTORY_MAX_BUFFER = int(os.environ.get("HISTORY_MAX_BUFFER", "10000"))
+HISTORY_PAGE_MAX = int(os.environ.get("HISTORY_PAGE_MAX", "100"))
+UPLOAD_WRITE_THREADS = int(os.environ.get("UPLOAD_WRITE_THREADS", "2"))
+UPLOAD_PENDING_MAX_BYTES = int(os.environ.get("UPLOAD_PENDING_MAX_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_THUMBNAIL_SIZE = int(os.environ.get("UPLOAD_THUMBNAIL_SIZE", "256"))
+UPLOAD_RETENTION_DAYS = float(os.environ.get("UPLOAD_RETENTION_DAYS", "0"))  # 0 = keep forever
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", "0"))  # 0 = no size limit
+UPLOAD_SWEEP_INTERVAL_SECONDS = float(os.environ.get("UPLOAD_SWEEP_INTERVAL_SECONDS", "3600"))
+# Reject images the detection model flags. Off by default: with it on, the
+# Gemini caption starts after predict (only for images that pass) instead of
+# alongside it, so accepted requests give up that overlap.
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "0") == "1"
+QUALITY_GATE_THRESHOLD = float(os.environ.get("QUALITY_GATE_THRESHOLD", "0.5"))  # P(defective) to reject at
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"  # honour the X-Profile header
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
 
 # --- 2. Flask & Mongo Setup ---
 app = Flask(__name__)
 app.config["MONGO_URI"] = "mongodb://localhost:27017/analysis_history_db"
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-mongo = PyMongo(app)
+# connect=False: no sockets or monitor threads until first use, so the app
+# can be imported (and forked) cheaply.
+mongo = PyMongo(app, connect=False)
+
+# --- Metrics ---
+# Exposed at /metrics. Request handlers are wrapped with @instrumented and time
+# their steps with `with stage("..."):`; background work reports through
+# observe_background.
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    "scry_request_seconds", "End-to-end handler latency.", ["handler"])
+STAGE_SECONDS = metrics.histogram(
+    "scry_stage_seconds", "Latency of one step inside a request handler.", ["handler", "stage"])
+BACKGROUND_SECONDS = metrics.histogram(
+    "scry_background_seconds", "Latency of work done off the request path.", ["task"])
+REQUESTS_IN_FLIGHT = metrics.gauge(
+    "scry_requests_in_flight", "Requests currently being handled.", ["handler"])
+REQUESTS_TOTAL = metrics.counter(
+    "scry_requests_total", "Requests handled, by response status.", ["handler", "status"])
+REQUEST_ERRORS = metrics.counter(
+    "scry_request_errors_total", "Requests answered with a 4xx or 5xx status.", ["handler", "status"])
+QUEUE_DEPTH = metrics.gauge(
+    "scry_queue_depth", "Items waiting in a background queue.", ["queue"])
+QUALITY_GATE_TOTAL = metrics.counter(
+    "scry_quality_gate_total", "Images checked by the quality gate, by outcome.", ["handler", "outcome"])
+POST_GATE_SECONDS = metrics.histogram(
+    "scry_quality_gate_post_seconds",
+    "Time an accepted request spends after the gate (Gemini, storage, Mongo).", ["handler"])
+QUALITY_GATE_SAVED = metrics.counter(
+    "scry_quality_gate_saved_seconds_total",
+    "Estimated request time saved by rejections (mean post-gate time per rejection).", ["handler"])
+
+def stage(name):
+    """Times one step of the current request into scry_stage_seconds."""
+    return STAGE_SECONDS.time(handler=g.get("handler", "other"), stage=name)
+
+def observe_background(task, seconds):
+    BACKGROUND_SECONDS.observe(seconds, task=task)
+
+def profiled(view, *args, **kwargs):
+    """Runs a view under cProfile; returns (response, profile file name or None).
+
+    Only the request thread is profiled: time spent in the batcher or the
+    caption pool shows up as waiting. One request is profiled at a time.
+    """
+    if not profile_lock.acquire(blocking=False):
+        return view(*args, **kwargs), None
+    try:
+        profiler = cProfile.Profile()
+        try:
+            response = profiler.runcall(view, *args, **kwargs)
+        finally:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{g.handler}-{int(time.time() * 1000)}-{os.getpid()}.prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        return response, name
+    finally:
+        profile_lock.release()
+
+profile_lock = threading.Lock()
+
+def instrumented(handler):
+    """Decorator: in-flight gauge, latency, status counters and opt-in profiling.
+
+    With PROFILE_REQUESTS=1, a request carrying ``X-Profile: 1`` is run under
+    cProfile; the .prof file lands in PROFILE_DIR and its name is returned
+    in the X-Profile-File header.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.handler = handler
+            REQUESTS_IN_FLIGHT.inc(handler=handler)
+            started = time.perf_counter()
+            status = 500
+            try:
+                if PROFILE_REQUESTS and request.headers.get("X-Profile") == "1":
+                    rv, profile_file = profiled(view, *args, **kwargs)
+                    response = make_response(rv)
+                    response.headers["X-Profile-File"] = profile_file or "busy"
+                else:
+                    response = make_response(view(*args, **kwargs))
+                status = response.status_code
+                return response
+            finally:
+                REQUESTS_IN_FLIGHT.dec(handler=handler)
+                REQUEST_SECONDS.observe(time.perf_counter() - started, handler=handler)
+                REQUESTS_TOTAL.inc(handler=handler, status=status)
+                if "gate_passed" in g:
+                    POST_GATE_SECONDS.observe(time.perf_counter() - g.gate_passed, handler=handler)
+                # Quality-gate rejections are answers, not errors.
+                if status >= 400 and not g.get("rejected"):
+                    REQUEST_ERRORS.inc(handler=handler, status=status)
+        return wrapper
+    return decorator
+
+# --- History Writer ---
+# Analysis records are buffered and written with insert_many off the request
+# path. The flush thread starts on the first write (after any fork); shutdown()
+# drains what is left.
+history_writer = HistoryWriter(
+    mongo.db.analysis_history,
+    max_batch=HISTORY_FLUSH_BATCH,
+    flush_interval=HISTORY_FLUSH_INTERVAL_MS / 1000,
+    max_buffer=HISTORY_MAX_BUFFER,
+    observe=observe_background,
+)
+
+# --- Upload Store ---
+# Content-addressed and sharded by digest; writes and previews happen on
+# background threads.
+upload_store = UploadStore(
+    UPLOAD_FOLDER,
+    write_threads=UPLOAD_WRITE_THREADS,
+    thumbnail_size=UPLOAD_THUMBNAIL_SIZE,
+    max_pending_bytes=UPLOAD_PENDING_MAX_BYTES,
+    observe=observe_background,
+)
+
+def shutdown():
+    """Drains queued upload and history writes. Runs at exit and in serve.py workers."""
+    upload_store.close()
+    history_writer.close()
+
+atexit.register(shutdown)
 
 # Ensure upload folder exists
 if not os.path.exists(UPLOAD_FOLDER):
@@ -35,20 +229,170 @@ if not os.path.exists(UPLOAD_FOLDER):
         print(f"Error creating upload directory: {e}")
 
 # --- 3. Gemini Client ---
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not set. Gemini calls will fail.")
-    genai_client = None
+# The genai client is created on first use (or during warm-up).
+if CAPTION_BACKEND == "stub":
+    captioner = StubCaptioner(delay_ms=CAPTION_STUB_DELAY_MS)
+elif GEMINI_API_KEY:
+    captioner = GeminiCaptioner(api_key=GEMINI_API_KEY, timeout=CAPTION_TIMEOUT_SECONDS)
 else:
-    genai_client = genai.Client(api_key=GEMINI_API_KEY)
+    print("Warning: GEMINI_API_KEY not set. Gemini calls will fail.")
+    captioner = None
+
+# Caption calls run on their own bounded pool so they overlap Keras inference.
+
+caption_service = CaptionService(
+    captioner,
+    max_workers=CAPTION_WORKERS,
+    max_pending=CAPTION_MAX_PENDING,
+    timeout=CAPTION_TIMEOUT_SECONDS,
+    breaker=CircuitBreaker(CAPTION_BREAKER_FAILURES, CAPTION_BREAKER_RESET_SECONDS),
+)
+caption_jobs = JobStore()
+
+ANALYSIS_PROMPT = "Describe handwriting personality in one line."
+OCR_PROMPT = "Extract the text from this image. Only return the raw text."
+
+# --- Load Model ---
+# Nothing heavy happens at import time. The model is loaded by ModelLoader,
+# started by serve.py at boot or by the first request, and warmed up with a
+# real predict before /healthz reports ready.
+PERSONALITY_MODEL_PATH = "./Keras model/personality_model.h5"
+DETECTION_MODEL_PATH = "./Keras model/detection model/keras_model.h5"
+
+def read_detection_labels():
+    """Index of the 'defective' class in the detection model's output."""
+    with open("./Keras model/detection model/labels.txt", "r") as f:
+        names = [line.strip().split(" ", 1)[-1].lower() for line in f if line.strip()]
+    return names.index("defective")
+
+DEFECTIVE_INDEX = read_detection_labels() if QUALITY_GATE else None
+
+def load_inference_model():
+    """Loads the configured backend, its labels and a (not yet started) batcher.
+
+    With QUALITY_GATE on, the backend is the fused personality + detection
+    graph: one predict returns both sets of scores (see split_scores). A
+    TFLite deployment without the fused export serves the personality model
+    alone, with the gate inactive.
+    """
+    model = load_backend(INFERENCE_BACKEND, PERSONALITY_MODEL_PATH, INFERENCE_THREADS,
+                         detector_path=DETECTION_MODEL_PATH if QUALITY_GATE else None,
+                         batch_sizes=INFERENCE_BATCH_BUCKETS)
+    with open("./Keras model/labels.txt", "r") as f:
+        class_names = f.readlines()
+
+    # --- Batched Inference ---
+    # One worker thread owns the model and serves every request thread through
+    # a queue, so concurrent uploads share a single batched predict call. The
+    # thread starts on warm-up, after any fork.
+    predictor = BatchingPredictor(
+        model.predict,
+        max_batch_size=INFERENCE_BATCH_SIZE,
+        max_wait_ms=INFERENCE_MAX_WAIT_MS,
+        queue_depth=INFERENCE_QUEUE_DEPTH,
+    )
+    return model, class_names, predictor
+
+def warm_up_inference(loaded):
+    """Runs a first predict at each batch size and starts background services."""
+    model, _, predictor = loaded
+    for size in getattr(model, "batch_sizes", sorted({1, INFERENCE_BATCH_SIZE})):
+        model.predict(np.zeros((size, 224, 224, 3), dtype=np.float32))
+    predictor.start()
+    # Index creation and the genai client can take a while (or time out when
+    # Mongo is down); readiness does not wait for them.
+    threading.Thread(target=warm_up_services, name="service-warm-up", daemon=True).start()
+
+def warm_up_services():
+    upload_store.start_sweeper(
+        UPLOAD_SWEEP_INTERVAL_SECONDS,
+        max_age_seconds=UPLOAD_RETENTION_DAYS * 86400,
+        max_bytes=UPLOAD_MAX_BYTES,
+    )
+    ensure_history_indexes(mongo.db.analysis_history)
+    analysis_cache.ensure_index()
+    ocr_cache.ensure_index()
+    if isinstance(captioner, GeminiCaptioner):
+        try:
+            captioner.client
+        except Exception as e:
+            print(f"Warning: could not create Gemini client: {e}")
+
+model_loader = ModelLoader(load_inference_model, warm_up_inference)
+
+def get_model(wait=MODEL_LOAD_WAIT_SECONDS):
+    """Returns (class_names, predictor) once the model is warm, else None."""
+    model_loader.start()
+    if not model_loader.wait(wait):
+        return None
+    _, class_names, predictor = model_loader.value
+    return class_names, predictor
+
+def model_unavailable():
+    """Error response for requests that arrive before the model is usable."""
+    if model_loader.status == "failed":
+        return jsonify({'error': 'Model is not loaded'}), 500
+    response = jsonify({'error': 'Model is warming up, please retry shortly'})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+def quality_gate_active():
+    """True when QUALITY_GATE is on and the loaded backend has the detector."""
+    loaded = model_loader.value
+    return QUALITY_GATE and loaded is not None and getattr(loaded[0], "fused", False)
+
+def split_scores(scores, class_names):
+    """Splits one output row into (personality scores, P(defective) or None)."""
+    if not quality_gate_active():
+        return scores, None
+    return scores[:len(class_names)], float(scores[len(class_names) + DEFECTIVE_INDEX])
+
+def quality_rejection(defect_score):
+    """Counts a gate rejection and returns the fields for its response."""
+    g.rejected = True
+    QUALITY_GATE_TOTAL.inc(handler=g.handler, outcome="rejected")
+    count, mean, _, _ = POST_GATE_SECONDS.summary(handler=g.handler)
+    if count:
+        QUALITY_GATE_SAVED.inc(mean, handler=g.handler)
+    return {
+        "error": "Image rejected: it looks blurry, blank or is not handwriting. Please upload a clearer photo.",
+        "rejected": True,
+        "defect_score": defect_score,
+    }
+
+def quality_passed():
+    QUALITY_GATE_TOTAL.inc(handler=g.handler, outcome="passed")
+    g.gate_passed = time.perf_counter()
+
+# Preallocated (224, 224, 3) input buffers, reused across requests.
+input_buffers = BufferPool(PREPROCESS_BUFFERS)
+
+def image_blob(image, file_bytes):
+    """The upload for Gemini: original bytes when it takes the format, else PNG."""
+    return gemini_image(image, file_bytes)
+
+# --- Result Cache ---
+# Keyed on a digest of the uploaded bytes. The analysis history record doubles
+# as the persistent tier; OCR results get their own small collection.
+def _memory_cache():
+    return LRUCache(
+        max_entries=RESULT_CACHE_MAX_ENTRIES,
+        max_bytes=RESULT_CACHE_MAX_BYTES,
+        ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    )
 
-# --- Load Keras Model ---
-try:
-    model = load_model("./Keras model/personality_model.h5", compile=False)
-    class_names = open("./Keras model/labels.txt", "r").readlines()
-except Exception as e:
-    print(f"ERROR loading Keras model: {e}")
-    model = None
-    class_names = []
+analysis_cache = ResultCache(
+    "analysis",
+    mongo.db.analysis_history,
+    ["keras_class", "keras_confidence", "gemini_caption", "image_url"],
+    memory=_memory_cache(),
+)
+ocr_cache = ResultCache(
+    "ocr",
+    mongo.db.ocr_results,
+    ["recognized_text"],
+    memory=_memory_cache(),
+)
 
 # --- CORS ---
 CORS(app, resources={
@@ -63,17 +407,126 @@ CORS(app, resources={
         "methods": ["POST", "OPTIONS"],
         "allow_headers": ["Content-Type"],
         "supports_credentials": True
+    },
+    r"/upload_and_analyze_bulk": {
+        "origins": ["http://localhost:5173", "http://127.0.0.1:5173", "http://192.168.29.178:5173"],
+        "methods": ["POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": True
+    },
+    r"/jobs/*": {
+        "origins": ["http://localhost:5173", "http://127.0.0.1:5173", "http://192.168.29.178:5173"],
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": True
+    },
+    r"/history*": {
+        "origins": ["http://localhost:5173", "http://127.0.0.1:5173", "http://192.168.29.178:5173"],
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": True
     }
 })
 
 # --- Helper ---
-def get_unique_filename(filename):
-    """Generates a UUID-based safe filename."""
-    cleaned_name = secure_filename(filename)
-    return f"{uuid.uuid4()}_{cleaned_name}"
+def store_upload(digest, file_bytes, image, filename):
+    """Queues the upload for storage; returns (stored_name, image_url)."""
+    stored_name = upload_store.save(digest, file_bytes, extension_for(image.format, filename))
+    return stored_name, f"{FILE_SERVER_BASE_URL}{stored_name}"
+
+def refresh_upload(digest, file_bytes, cached, filename):
+    """Keeps the file behind a cached result stored; returns its image_url.
+
+    A cache hit skips store_upload, so without this the sweeper would age the
+    file out while the cache keeps handing out its URL. Saving again only
+    touches the file when it exists and rewrites it when it was swept.
+    Results pointing at a legacy upload are moved to a content-addressed name.
+    """
+    image_url = cached["image_url"]
+    match = CONTENT_NAME.match((image_url or "").rsplit("/", 1)[-1])
+    if match is not None and match.group(1) == digest:
+        upload_store.save(digest, file_bytes, match.group(2))
+        return image_url
+    stored_name = upload_store.save(digest, file_bytes, extension_for(None, filename))
+    image_url = f"{FILE_SERVER_BASE_URL}{stored_name}"
+    analysis_cache.put(digest, dict(cached, image_url=image_url))
+    return image_url
+
+def thumbnail_url(image_url):
+    """URL of the preview for an upload; the original for legacy files."""
+    name = thumbnail_name(image_url.rsplit("/", 1)[-1]) if image_url else None
+    return f"{FILE_SERVER_BASE_URL}{name}" if name else image_url
+
+PERSONALITY_DESCRIPTIONS = {
+    "Openness": "Imaginative and curious personality.",
+    "Conscientiousness": "Organized and disciplined personality.",
+    "Extraversion": "Energetic and outgoing personality.",
+    "Agreeableness": "Cooperative and compassionate personality.",
+    "Neuroticism": "Prone to emotional instability."
+}
+
+def analysis_response(class_name, confidence, defect_description, image_url, cached=False,
+                      job_id=None):
+    """Builds the JSON body returned by /upload_and_analyze."""
+    body = {
+        "class": class_name,
+        "confidence": confidence,
+        "personality_description": PERSONALITY_DESCRIPTIONS.get(class_name, f"Trait: {class_name}"),
+        "defect_description": defect_description,
+        "image_url": image_url,
+        "thumbnail_url": thumbnail_url(image_url),
+        "cached": cached,
+        "message": "Analysis complete."
+    }
+    if job_id is not None:
+        body["job_id"] = job_id
+        body["message"] = "Analysis complete, caption pending."
+    return jsonify(body)
+
+def start_caption(image, prompt, wait=None):
+    """Submits a caption call; returns (future, error_message)."""
+    try:
+        future = caption_service.submit(image, prompt, wait=wait)
+    except CaptionUnavailableError as e:
+        if caption_service.captioner is None:
+            return None, "Gemini API key missing."
+        return None, f"Gemini error: {e}"
+    started = time.perf_counter()
+    future.add_done_callback(lambda f: observe_background("gemini_call", time.perf_counter() - started))
+    return future, None
+
+def wait_caption(future, error):
+    """Resolves a caption started by start_caption; returns (text, ok)."""
+    if future is None:
+        return error, False
+    try:
+        return caption_service.result(future), True
+    except Exception as e:
+        return f"Gemini error: {e}", False
+
+def finish_caption_job(job_id, record_id, digest, keras_result, future):
+    """Done-callback for async captions: updates the job and the history record."""
+    try:
+        caption, ok = future.result(), True
+    except Exception as e:
+        caption, ok = f"Gemini error: {e}", False
+
+    update = {"gemini_caption": caption, "caption_status": "done" if ok else "failed"}
+    if ok:
+        update["file_digest"] = digest
+    try:
+        # Patches the buffered record if it has not been flushed yet.
+        history_writer.update(record_id, update)
+    except PyMongoError as e:
+        print(f"Failed to store caption for job {job_id}: {e}")
+
+    caption_jobs.finish(job_id, status=update["caption_status"], defect_description=caption)
+    if ok:
+        analysis_cache.put(digest, dict(keras_result, gemini_caption=caption))
 
 # --- 4. Combined Upload & Analyze Route ---
 @app.route('/upload_and_analyze', methods=['POST'])
+@instrumented("analyze")
 def upload_and_analyze_and_log():
     file = request.files.get('image')
 
@@ -83,118 +536,547 @@ def upload_and_analyze_and_log():
     if not UPLOAD_FOLDER:
         return jsonify({'error': 'UPLOAD_FOLDER is not configured'}), 500
 
+    file_bytes = file.read()
+    with stage("cache_lookup"):
+        digest = file_digest(file_bytes)
+        cached = analysis_cache.get(digest)
+    if cached is not None:
+        return analysis_response(
+            cached["keras_class"],
+            cached["keras_confidence"],
+            cached["gemini_caption"],
+            refresh_upload(digest, file_bytes, cached, file.filename),
+            cached=True,
+        )
+
+    loaded = get_model()
+    if loaded is None:
+        return model_unavailable()
+    class_names, predictor = loaded
+
     try:
-        file_bytes = file.read()
-        image = Image.open(BytesIO(file_bytes)).convert("RGB")
+        # Reduced-size decode; the model only needs 224x224.
+        with stage("decode"):
+            image = open_image(file_bytes, draft=PREPROCESS_JPEG_DRAFT)
+            image.load()
+        with stage("fit"):
+            resized = fit(image, resample=PREPROCESS_RESAMPLING)
     except Exception as e:
         return jsonify({'error': f"Error opening image: {e}"}), 500
 
-    unique_filename = get_unique_filename(file.filename)
+    async_caption = request.values.get("async", "").lower() in ("1", "true", "yes")
 
     try:
-        # Save file locally
-        save_path = os.path.join(app.config["UPLOAD_FOLDER"], unique_filename)
-        with open(save_path, "wb") as f:
-            f.write(file_bytes)
+        caption_future, caption_error = None, None
+        if not quality_gate_active():
+            # Start the Gemini caption first so it runs while Keras predicts.
+            caption_future, caption_error = start_caption(image_blob(image, file_bytes), ANALYSIS_PROMPT)
 
-        image_url = f"{FILE_SERVER_BASE_URL}{unique_filename}"
+        # Keras prediction (batched with other in-flight requests)
+        with input_buffers.buffer() as normalized:
+            normalize_into(resized, normalized)
+            try:
+                with stage("predict"):
+                    prediction = predictor.predict(normalized)
+            except QueueFullError:
+                if caption_future is not None:
+                    caption_future.cancel()
+                return jsonify({'error': 'Server is busy, please retry shortly'}), 503
 
-        # Keras prediction
-        resized = ImageOps.fit(image, (224, 224), Image.Resampling.LANCZOS)
-        arr = np.asarray(resized)
-        normalized = (arr.astype(np.float32) / 127.5) - 1
-        data = np.ndarray((1, 224, 224, 3), dtype=np.float32)
-        data[0] = normalized
+        prediction, defect_score = split_scores(prediction, class_names)
+        if defect_score is not None:
+            # Quality gate: defective images stop here, before the paid
+            # Gemini call, the disk write and the history record.
+            if defect_score >= QUALITY_GATE_THRESHOLD:
+                return jsonify(quality_rejection(defect_score)), 422
+            quality_passed()
+            caption_future, caption_error = start_caption(image_blob(image, file_bytes), ANALYSIS_PROMPT)
 
-        prediction = model.predict(data)
         index = np.argmax(prediction)
         class_name = class_names[index].strip()
-        confidence = float(prediction[0][index])
-
-        descriptions = {
-            "Openness": "Imaginative and curious personality.",
-            "Conscientiousness": "Organized and disciplined personality.",
-            "Extraversion": "Energetic and outgoing personality.",
-            "Agreeableness": "Cooperative and compassionate personality.",
-            "Neuroticism": "Prone to emotional instability."
+        confidence = float(prediction[index])
+
+        # Store the file (written in the background, deduplicated by digest)
+        with stage("disk_write"):
+            stored_name, image_url = store_upload(digest, file_bytes, image, file.filename)
+
+        keras_result = {
+            "keras_class": class_name,
+            "keras_confidence": confidence,
+            "image_url": image_url,
         }
-        personality_description = descriptions.get(class_name, f"Trait: {class_name}")
+        record_id = ObjectId()
+
+        # Opt-in async mode: answer with the Keras result now and let the
+        # caption land in the job store and the history record later.
+        if async_caption and caption_future is not None:
+            with stage("mongo"):
+                history_writer.add({
+                    "_id": record_id,
+                    "original_filename": file.filename,
+                    "local_filename": stored_name,
+                    "image_url": image_url,
+                    "analysis_time": datetime.utcnow(),
+                    "user_session": request.remote_addr,
+                    "keras_class": class_name,
+                    "keras_confidence": confidence,
+                    "gemini_caption": None,
+                    "caption_status": "pending"
+                })
+            job_id = str(record_id)
+            caption_jobs.create(job_id, **{
+                "class": class_name,
+                "confidence": confidence,
+                "image_url": image_url,
+                "defect_description": None,
+            })
+            caption_future.add_done_callback(
+                lambda f: finish_caption_job(job_id, record_id, digest, keras_result, f)
+            )
+            return analysis_response(class_name, confidence, None, image_url, job_id=job_id), 202
 
         # Gemini Interpretation
-        try:
-            if not genai_client:
-                defect_description = "Gemini API key missing."
-            else:
-                response = genai_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[image, "Describe handwriting personality in one line."]
-                )
-                defect_description = response.text.strip()
-        except Exception as e:
-            defect_description = f"Gemini error: {e}"
+        with stage("gemini"):
+            defect_description, caption_ok = wait_caption(caption_future, caption_error)
 
-        # Save to MongoDB
-        mongo.db.analysis_history.insert_one({
+        # Save to MongoDB. Only complete analyses carry the digest, so a
+        # failed Gemini call is retried on the next identical upload.
+        record = {
+            "_id": record_id,
             "original_filename": file.filename,
-            "local_filename": unique_filename,
+            "local_filename": stored_name,
             "image_url": image_url,
             "analysis_time": datetime.utcnow(),
             "user_session": request.remote_addr,
             "keras_class": class_name,
             "keras_confidence": confidence,
             "gemini_caption": defect_description
-        })
+        }
+        if caption_ok:
+            record["file_digest"] = digest
+        # Buffered; a duplicate digest from a concurrent request for the same
+        # bytes is dropped from the record at flush time.
+        with stage("mongo"):
+            history_writer.add(record)
+
+        if caption_ok:
+            analysis_cache.put(digest, dict(keras_result, gemini_caption=defect_description))
+
+        return analysis_response(class_name, confidence, defect_description, image_url)
+
+    except Exception as e:
+        print(f"Server error: {e}")
+        return jsonify({"error": f"Unexpected server error: {e}"}), 500
+
+# --- 5. Bulk Upload & Analyze Route ---
+# Decoding releases the GIL, so a small pool fills a bulk batch in parallel.
+bulk_decode_pool = ThreadPoolExecutor(max_workers=BULK_DECODE_THREADS, thread_name_prefix="bulk-decode")
+
+bulk_caption_window = threading.BoundedSemaphore(BULK_CAPTION_WINDOW)
+
+def start_bulk_caption(image):
+    """start_caption for a bulk row: waits for a free slot instead of failing.
+
+    At most BULK_CAPTION_WINDOW bulk captions are pending at once, so a large
+    upload is throttled to that window rather than filling the caption
+    service and getting "too many in flight" for every row past the cap.
+    """
+    if not bulk_caption_window.acquire(timeout=CAPTION_TIMEOUT_SECONDS):
+        return None, "Gemini error: timed out waiting for a bulk caption slot"
+    future, error = start_caption(image, ANALYSIS_PROMPT, wait=CAPTION_TIMEOUT_SECONDS)
+    if future is None:
+        bulk_caption_window.release()
+    else:
+        future.add_done_callback(lambda _: bulk_caption_window.release())
+    return future, error
+
+def ndjson(obj):
+    return json.dumps(obj) + "\n"
+
+@app.route('/upload_and_analyze_bulk', methods=['POST'])
+def bulk_upload_and_analyze():
+    """Analyzes many images from one multipart or zip upload, streaming NDJSON.
+
+    One line per image as each batch finishes, then a final summary line.
+    A skipped file (too large, unreadable zip entry) gets an error line; if
+    the body breaks off, the images that did arrive are still analyzed.
+    Gemini captions are off unless ?caption=1 is given; they are started
+    through a bounded window (BULK_CAPTION_WINDOW), see start_bulk_caption.
+    """
+    if not UPLOAD_FOLDER:
+        return jsonify({'error': 'UPLOAD_FOLDER is not configured'}), 500
+
+    if request.mimetype != "multipart/form-data" and request.mimetype not in ZIP_TYPES:
+        return jsonify({'error': 'Send images as multipart/form-data or a zip archive'}), 400
+
+    loaded = get_model()
+    if loaded is None:
+        return model_unavailable()
+    class_names, _ = loaded
+    model = model_loader.value[0]
 
-        return jsonify({
+    with_caption = request.args.get("caption", "").lower() in ("1", "true", "yes")
+    # Read the body incrementally; request.files would buffer all of it first.
+    uploads = iter_uploads(request.stream, request.content_type, BULK_MAX_FILE_BYTES)
+    session = request.remote_addr
+
+    return Response(
+        stream_with_context(bulk_results(uploads, model, class_names, with_caption, session)),
+        mimetype="application/x-ndjson",
+    )
+
+def bulk_results(uploads, model, class_names, with_caption, session):
+    batch = np.empty((BULK_BATCH_SIZE, 224, 224, 3), dtype=np.float32)
+    summary = {"images": 0, "analyzed": 0, "cached": 0, "rejected": 0, "errors": 0}
+    pending = []
+    try:
+        for index, (filename, file_bytes) in enumerate(uploads):
+            summary["images"] += 1
+            if isinstance(file_bytes, SkippedUpload):
+                summary["errors"] += 1
+                yield ndjson({"index": index, "filename": filename, "error": f"Skipped: {file_bytes}"})
+                continue
+            digest = file_digest(file_bytes)
+            cached = analysis_cache.get(digest)
+            if cached is not None:
+                summary["cached"] += 1
+                image_url = refresh_upload(digest, file_bytes, cached, filename)
+                yield ndjson({
+                    "index": index,
+                    "filename": filename,
+                    "class": cached["keras_class"],
+                    "confidence": cached["keras_confidence"],
+                    "personality_description": PERSONALITY_DESCRIPTIONS.get(
+                        cached["keras_class"], f"Trait: {cached['keras_class']}"),
+                    "defect_description": cached["gemini_caption"],
+                    "image_url": image_url,
+                    "thumbnail_url": thumbnail_url(image_url),
+                    "cached": True,
+                })
+                continue
+
+            pending.append((index, filename, file_bytes, digest))
+            if len(pending) == BULK_BATCH_SIZE:
+                yield from analyze_bulk_batch(pending, batch, model, class_names, with_caption, session, summary)
+                pending = []
+    except BulkUploadError as e:
+        # The body broke off; still answer for the images that did arrive.
+        if pending:
+            yield from analyze_bulk_batch(pending, batch, model, class_names, with_caption, session, summary)
+            pending = []
+        summary["errors"] += 1
+        yield ndjson({"error": f"Bad upload: {e}"})
+    if pending:
+        yield from analyze_bulk_batch(pending, batch, model, class_names, with_caption, session, summary)
+    yield ndjson({"summary": summary})
+
+def analyze_bulk_batch(items, batch, model, class_names, with_caption, session, summary):
+    """Runs one batched predict for ``items`` and persists them with insert_many.
+
+    Rows the quality gate rejects get a ``rejected`` line and are neither
+    captioned nor stored.
+    """
+    def decode(row):
+        try:
+            image = open_image(items[row][2], draft=PREPROCESS_JPEG_DRAFT)
+            preprocess(image, out=batch[row], resample=PREPROCESS_RESAMPLING)
+            return image
+        except Exception as e:
+            return e
+
+    images = list(bulk_decode_pool.map(decode, range(len(items))))
+
+    # Rows whose decode failed hold stale data; their scores are ignored.
+    predictions = model.predict(batch[:len(items)])
+
+    scores, rejected = {}, {}
+    for row, image in enumerate(images):
+        if isinstance(image, Exception):
+            continue
+        scores[row], defect_score = split_scores(predictions[row], class_names)
+        if defect_score is not None and defect_score >= QUALITY_GATE_THRESHOLD:
+            rejected[row] = defect_score
+            QUALITY_GATE_TOTAL.inc(handler="bulk", outcome="rejected")
+        elif defect_score is not None:
+            QUALITY_GATE_TOTAL.inc(handler="bulk", outcome="passed")
+
+    captions = {}
+    if with_caption:
+        for row, image in enumerate(images):
+            if row in scores and row not in rejected:
+                captions[row] = start_bulk_caption(image_blob(image, items[row][2]))
+
+    lines, records, cache_entries = [], [], []
+    for row, (index, filename, file_bytes, digest) in enumerate(items):
+        image = images[row]
+        if isinstance(image, Exception):
+            summary["errors"] += 1
+            lines.append({"index": index, "filename": filename, "error": f"Error opening image: {image}"})
+            continue
+        if row in rejected:
+            summary["rejected"] += 1
+            lines.append({
+                "index": index,
+                "filename": filename,
+                "rejected": True,
+                "defect_score": rejected[row],
+                "error": "Image rejected by the quality check",
+            })
+            continue
+
+        class_index = int(np.argmax(scores[row]))
+        class_name = class_names[class_index].strip()
+        confidence = float(scores[row][class_index])
+
+        stored_name, image_url = store_upload(digest, file_bytes, image, filename)
+
+        if row in captions:
+            defect_description, caption_ok = wait_caption(*captions[row])
+            caption_status = "done" if caption_ok else "failed"
+        else:
+            defect_description, caption_ok, caption_status = None, False, "skipped"
+
+        record = {
+            "original_filename": filename,
+            "local_filename": stored_name,
+            "image_url": image_url,
+            "analysis_time": datetime.utcnow(),
+            "user_session": session,
+            "keras_class": class_name,
+            "keras_confidence": confidence,
+            "gemini_caption": defect_description,
+            "caption_status": caption_status,
+            "bulk": True
+        }
+        if caption_ok:
+            record["file_digest"] = digest
+            cache_entries.append((digest, {
+                "keras_class": class_name,
+                "keras_confidence": confidence,
+                "gemini_caption": defect_description,
+                "image_url": image_url,
+            }))
+        records.append(record)
+
+        summary["analyzed"] += 1
+        lines.append({
+            "index": index,
+            "filename": filename,
             "class": class_name,
             "confidence": confidence,
-            "personality_description": personality_description,
+            "personality_description": PERSONALITY_DESCRIPTIONS.get(class_name, f"Trait: {class_name}"),
             "defect_description": defect_description,
             "image_url": image_url,
-            "message": "Analysis complete."
+            "thumbnail_url": thumbnail_url(image_url),
+            "cached": False,
         })
 
-    except Exception as e:
-        print(f"Server error: {e}")
-        return jsonify({"error": f"Unexpected server error: {e}"}), 500
+    if records:
+        history_writer.add_many(records)
+    for digest, value in cache_entries:
+        analysis_cache.put(digest, value)
+
+    for line in lines:
+        yield ndjson(line)
 
 # --- File Serving ---
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # content-addressed files never change
+
 @app.route('/uploads/<filename>')
 def serve_uploads(filename):
+    """Serves an upload or its preview with ETag/Last-Modified, 304s and ranges."""
+    match = CONTENT_NAME.match(filename)
+    if match is None:
+        # Legacy uuid_filename uploads in the flat folder.
+        try:
+            return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+        except FileNotFoundError:
+            return "File not found", 404
+
+    name, max_age = filename, IMMUTABLE_MAX_AGE
+    if ".thumb." in name and upload_store.pending(name) is None and not os.path.exists(upload_store.path(name)):
+        # Preview not built yet: serve the original without long-term caching.
+        name, max_age = upload_store.original_for(match.group(1)), 0
+        if name is None:
+            return "File not found", 404
+
+    etag = name.replace(".", "-")
+    data = upload_store.pending(name)
     try:
-        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+        if data is not None:
+            # Not on disk yet; serve the bytes still held in memory.
+            response = send_file(BytesIO(data), mimetype=mimetypes.guess_type(name)[0],
+                                 etag=etag, conditional=True, max_age=max_age)
+        else:
+            response = send_file(upload_store.path(name), etag=etag, conditional=True, max_age=max_age)
     except FileNotFoundError:
         return "File not found", 404
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
 
 # --- OCR Route ---
 @app.route('/api/ocr-recognize', methods=['POST'])
+@instrumented("ocr")
 def ocr_recognize():
     if 'handwriting_image' not in request.files:
         return jsonify({'error': 'No image file provided'}), 400
 
-    if not genai_client:
-        return jsonify({'error': 'GEMINI_API_KEY missing'}), 500
-
     file = request.files['handwriting_image']
+    file_bytes = file.read()
+    with stage("cache_lookup"):
+        digest = file_digest(file_bytes)
+        cached = ocr_cache.get(digest)
+    if cached is not None:
+        return jsonify({"recognized_text": cached["recognized_text"], "status": "success", "cached": True})
 
-    try:
-        image = Image.open(BytesIO(file.read()))
-        prompt = "Extract the text from this image. Only return the raw text."
-
-        response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[image, prompt]
-        )
+    if caption_service.captioner is None:
+        return jsonify({'error': 'GEMINI_API_KEY missing'}), 500
 
-        recognized_text = response.text.strip()
+    try:
+        with stage("decode"):
+            image = Image.open(BytesIO(file_bytes))
+        with stage("gemini"):
+            recognized_text = caption_service.caption(image_blob(image, file_bytes), OCR_PROMPT)
         if not recognized_text:
             recognized_text = "No recognizable text found."
 
+        with stage("mongo"):
+            ocr_cache.put(digest, {"recognized_text": recognized_text}, persist=True)
+
         return jsonify({"recognized_text": recognized_text, "status": "success"})
 
+    except CaptionUnavailableError as e:
+        return jsonify({'error': f"OCR unavailable: {e}"}), 503
     except Exception as e:
         return jsonify({'error': f"OCR failed: {e}"}), 500
 
+# --- Caption Jobs ---
+@app.route('/jobs/<job_id>')
+def get_caption_job(job_id):
+    job = caption_jobs.get(job_id)
+    if job is None:
+        # Not started by this process (or already pruned); the history
+        # record is the source of truth.
+        try:
+            record_id = ObjectId(job_id)
+        except InvalidId:
+            record_id = None
+        record = None
+        if record_id is not None:
+            record = history_writer.find(record_id) or mongo.db.analysis_history.find_one({"_id": record_id})
+        if record is None:
+            return jsonify({'error': 'Job not found'}), 404
+        job = {
+            "status": record.get("caption_status", "done"),
+            "class": record.get("keras_class"),
+            "confidence": record.get("keras_confidence"),
+            "image_url": record.get("image_url"),
+            "defect_description": record.get("gemini_caption"),
+        }
+    return jsonify(dict(job, job_id=job_id))
+
+# --- History ---
+HISTORY_FIELDS = [
+    "original_filename", "image_url", "user_session", "keras_class",
+    "keras_confidence", "gemini_caption", "caption_status",
+]
+
+def parse_time(name):
+    """Reads an optional ISO-8601 query parameter; raises ValueError."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO-8601 time") from None
+
+@app.route('/history')
+def get_history():
+    """Newest-first analysis history, paginated with an opaque cursor.
+
+    Pass the returned ``next_cursor`` as ``?cursor=`` for the next page. The
+    cursor is a position in (analysis_time, _id) order, so pages stay stable
+    while new records arrive and deep pages cost the same as the first.
+    Records still in the write buffer show up after the next flush.
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", "20")), 1), HISTORY_PAGE_MAX)
+    except ValueError:
+        return jsonify({'error': "'limit' must be an integer"}), 400
+    try:
+        docs, next_cursor = history_page(
+            mongo.db.analysis_history,
+            limit=limit,
+            cursor=request.args.get("cursor"),
+            keras_class=request.args.get("class"),
+            user_session=request.args.get("session"),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except PyMongoError as e:
+        return jsonify({'error': f"History unavailable: {e}"}), 503
+
+    items = []
+    for doc in docs:
+        item = {"id": str(doc["_id"]), "analysis_time": doc["analysis_time"].isoformat()}
+        item.update({field: doc.get(field) for field in HISTORY_FIELDS})
+        items.append(item)
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+@app.route('/history/stats')
+def get_history_stats():
+    """Class distribution and mean confidence, overall and per time bucket."""
+    bucket = request.args.get("bucket", "day")
+    if bucket not in BUCKET_FORMATS:
+        return jsonify({'error': f"'bucket' must be one of {', '.join(BUCKET_FORMATS)}"}), 400
+    try:
+        since, until = parse_time("since"), parse_time("until")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        stats = history_stats(
+            mongo.db.analysis_history,
+            bucket=bucket,
+            since=since,
+            until=until,
+            keras_class=request.args.get("class"),
+            user_session=request.args.get("session"),
+        )
+    except PyMongoError as e:
+        return jsonify({'error': f"History unavailable: {e}"}), 503
+    return jsonify(stats)
+
+# --- Health ---
+@app.route('/healthz')
+def healthz():
+    model_loader.start()
+    body = dict(model_loader.info(), backend=INFERENCE_BACKEND, pid=os.getpid(),
+                quality_gate={"enabled": QUALITY_GATE, "active": quality_gate_active(),
+                              "threshold": QUALITY_GATE_THRESHOLD},
+                history_writer=history_writer.stats(), upload_store=upload_store.stats())
+    return jsonify(body), 200 if model_loader.ready else 503
+
+# --- Metrics Endpoint ---
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text format; per process (see metrics.py)."""
+    if model_loader.value is not None:
+        QUEUE_DEPTH.set(model_loader.value[2].qsize(), queue="inference")
+    QUEUE_DEPTH.set(history_writer.pending(), queue="history")
+    QUEUE_DEPTH.set(upload_store.stats()["pending"], queue="upload_write")
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+# --- Cache Stats ---
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        "analysis": analysis_cache.stats(),
+        "ocr": ocr_cache.stats(),
+    })
+
 # --- Preflight ---
 @app.route('/caption', methods=['OPTIONS'])
 def handle_options():
@@ -205,4 +1087,7 @@ def handle_options():
     return response
 
 if __name__ == '__main__':
+    # Under the debug reloader only the serving child should load the model.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        model_loader.start()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""In-process micro-batching for Keras inference.
+
+Request threads hand a preprocessed (224, 224, 3) tensor to the predictor and
+block on a Future. A single worker thread drains the queue, gathers up to
+``max_batch_size`` tensors (or whatever arrived within ``max_wait_ms``) and
+runs one batched predict for all of them.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue has no room for another request."""
+
+
+_STOP = object()
+
+
+class BatchingPredictor:
+    """Groups concurrent single-image predictions into batched model calls."""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0,
+                 queue_depth=256, input_shape=(224, 224, 3)):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._batch = np.empty((max_batch_size, *input_shape), dtype=np.float32)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker thread (idempotent)."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="inference-batcher", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Lets queued requests finish, then stops the worker thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def submit(self, tensor):
+        """Queues one preprocessed image and returns a Future for its scores."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        future = Future()
+        try:
+            self._queue.put_nowait((tensor, future))
+        except queue.Full:
+            raise QueueFullError("Inference queue is full") from None
+        return future
+
+    def predict(self, tensor, timeout=None):
+        """Blocking helper: returns the score vector for one image."""
+        return self.submit(tensor).result(timeout)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _collect(self, first):
+        items = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            items.append(item)
+        return items, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            items, stop = self._collect(first)
+            live = [(t, f) for t, f in items if f.set_running_or_notify_cancel()]
+            if live:
+                self._run_batch(live)
+            if stop:
+                return
+
+    def _run_batch(self, live):
+        n = len(live)
+        try:
+            for i, (tensor, _) in enumerate(live):
+                self._batch[i] = tensor
+            predictions = np.asarray(self.predict_fn(self._batch[:n]))
+        except Exception as e:
+            for _, future in live:
+                future.set_exception(e)
+            return
+
+        for i, (_, future) in enumerate(live):
+            future.set_result(predictions[i])
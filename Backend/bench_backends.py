@@ -0,0 +1,207 @@
+"""Agreement, accuracy, latency and memory check for each inference backend.
+
+Every backend runs in its own subprocess so load time and resident memory are
+measured in isolation. Outputs are compared with the Keras backend: top-1
+agreement and the largest absolute score difference. With --labelled-dir
+(class-per-folder) each backend's accuracy is reported too.
+
+    python bench_backends.py --images ../samples
+    python bench_backends.py --labelled-dir "D:/datasets/scry/test" --backends keras tflite-int8
+    python bench_backends.py --fused    # personality + detection graph, as served with QUALITY_GATE=1
+
+Besides single-image and full-batch timings, batches of random size
+(1 .. --batch-size, as the micro-batcher produces under uneven load) are
+timed; TFLite backends pad those up to the nearest of --buckets.
+
+With --fused, agreement and accuracy use the personality columns; compare the
+ms columns with a plain run to see what the detector adds. The share of
+images the detector flags as defective is reported too.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+DEFAULT_MODEL = "./Keras model/personality_model.h5"
+DEFAULT_LABELS = "./Keras model/labels.txt"
+DEFAULT_DETECTOR = "./Keras model/detection model/keras_model.h5"
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), or peak RSS elsewhere on Unix."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+def list_images(images_dir, labelled_dir, labels_path):
+    """Returns (paths, targets); targets is None without a labelled dataset."""
+    if not labelled_dir:
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(images_dir, pattern)))
+        return sorted(paths), None
+
+    with open(labels_path) as f:
+        names = [line.strip().split(" ", 1)[-1].lower() for line in f if line.strip()]
+    paths, targets = [], []
+    for folder in sorted(os.listdir(labelled_dir)):
+        if folder.lower() not in names:
+            continue
+        for pattern in IMAGE_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(labelled_dir, folder, pattern))):
+                paths.append(path)
+                targets.append(names.index(folder.lower()))
+    return paths, targets
+
+
+def worker(args):
+    """Subprocess body: load one backend, time it, dump scores and stats as JSON."""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    from inference_backends import load_backend
+    from preprocessing import preprocess_batch
+
+    buckets = [int(n) for n in args.buckets.split(",")] if args.buckets else [1, 4, args.batch_size]
+    backend = load_backend(args.worker, args.model, detector_path=args.detector if args.fused else None,
+                           batch_sizes=buckets)
+    load_seconds = time.perf_counter() - start
+
+    with open(args.paths_file) as f:
+        paths = json.load(f)
+    inputs = preprocess_batch(paths)
+
+    for size in sorted(set(buckets)):
+        backend.predict(inputs[:size])  # warm-up
+    single = []
+    for i in range(len(inputs)):
+        t = time.perf_counter()
+        backend.predict(inputs[i:i + 1])
+        single.append(time.perf_counter() - t)
+
+    scores = []
+    batched = []
+    for i in range(0, len(inputs), args.batch_size):
+        t = time.perf_counter()
+        scores.append(backend.predict(inputs[i:i + args.batch_size]))
+        batched.append((time.perf_counter() - t) / len(inputs[i:i + args.batch_size]))
+
+    varied, varied_images = [], 0
+    sizes = np.random.default_rng(0).integers(1, args.batch_size + 1, size=max(8, len(inputs) // 4))
+    for i, n in enumerate(sizes):
+        start_row = (i * args.batch_size) % len(inputs)
+        chunk = inputs[start_row:start_row + n]
+        t = time.perf_counter()
+        backend.predict(chunk)
+        varied.append(time.perf_counter() - t)
+        varied_images += len(chunk)
+
+    single_ms = np.array(single) * 1000
+    json.dump({
+        "backend": args.worker,
+        "load_seconds": load_seconds,
+        "rss_before_mb": rss_before,
+        "rss_mb": rss_mb(),
+        "p50_ms": float(np.percentile(single_ms, 50)),
+        "p99_ms": float(np.percentile(single_ms, 99)),
+        "batched_ms_per_image": float(np.mean(batched) * 1000),
+        "varied_ms_per_image": float(sum(varied) / varied_images * 1000),
+        "varied_p99_ms": float(np.percentile(np.array(varied) * 1000, 99)),
+        "scores": np.concatenate(scores).tolist(),
+    }, sys.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=["keras", "tflite-float", "tflite-int8"])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--labels", default=DEFAULT_LABELS)
+    parser.add_argument("--images", default=os.path.join("..", "samples"))
+    parser.add_argument("--labelled-dir", help="class-per-folder dataset for accuracy")
+    parser.add_argument("--limit", type=int, default=500, help="max images (all are held in memory)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--buckets", help="TFLite batch sizes, e.g. 1,4,16,32 (default 1,4,--batch-size)")
+    parser.add_argument("--fused", action="store_true", help="benchmark the fused model + detector graph")
+    parser.add_argument("--detector", default=DEFAULT_DETECTOR)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--paths-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    paths, targets = list_images(args.images, args.labelled_dir, args.labels)
+    if len(paths) > args.limit:
+        # Spread the sample across classes rather than taking the first folder.
+        keep = np.linspace(0, len(paths) - 1, args.limit).astype(int)
+        paths = [paths[i] for i in keep]
+        targets = [targets[i] for i in keep] if targets is not None else None
+    if not paths:
+        parser.error("no images found")
+    paths_file = os.path.abspath(".bench_backends_paths.json")
+    with open(paths_file, "w") as f:
+        json.dump(paths, f)
+
+    results = {}
+    try:
+        for kind in args.backends:
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", kind,
+                   "--model", args.model, "--batch-size", str(args.batch_size),
+                   "--paths-file", paths_file, "--detector", args.detector]
+            if args.buckets:
+                cmd += ["--buckets", args.buckets]
+            if args.fused:
+                cmd.append("--fused")
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{kind}: failed\n{proc.stderr.strip()[-2000:]}")
+                continue
+            # TensorFlow may log to stdout before the JSON payload.
+            results[kind] = json.loads(proc.stdout[proc.stdout.index('{"backend"'):])
+    finally:
+        os.remove(paths_file)
+
+    with open(args.labels) as f:
+        num_classes = sum(1 for line in f if line.strip())
+    reference = np.array(results["keras"]["scores"])[:, :num_classes] if "keras" in results else None
+    print(f"{len(paths)} images\n")
+    print(f"{'backend':<14}{'load s':>8}{'RSS MB':>9}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'batch ms/img':>14}{'varied ms/img':>15}{'varied p99':>12}{'agree':>8}{'max |d|':>10}{'accuracy':>10}")
+    for kind, r in results.items():
+        scores = np.array(r["scores"])
+        if args.fused:
+            # Detection columns follow the personality ones; the last is "defective".
+            r["defective"] = float(np.mean(scores[:, -1] >= 0.5))
+            scores = scores[:, :num_classes]
+        agree = max_diff = accuracy = ""
+        if reference is not None:
+            agree = f"{np.mean(scores.argmax(1) == reference.argmax(1)):.1%}"
+            max_diff = f"{np.abs(scores - reference).max():.4f}"
+        if targets is not None:
+            accuracy = f"{np.mean(scores.argmax(1) == np.array(targets)):.1%}"
+        rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "n/a"
+        print(f"{kind:<14}{r['load_seconds']:>8.2f}{rss:>9}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['batched_ms_per_image']:>14.2f}{r['varied_ms_per_image']:>15.2f}{r['varied_p99_ms']:>12.2f}"
+              f"{agree:>8}{max_diff:>10}{accuracy:>10}")
+    if args.fused:
+        print("\nflagged defective at 0.5: " + ", ".join(f"{k} {r['defective']:.1%}" for k, r in results.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark: per-request model.predict vs. the micro-batching predictor.
+
+Drives the model from N concurrent client threads and reports requests/s and
+p50/p99 latency for both paths.
+
+    python bench_batching.py --clients 16 --requests 2000 --batch-size 16 --max-wait-ms 5
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+from keras.models import load_model
+
+from batcher import BatchingPredictor
+
+
+def per_request_call(model):
+    """The pre-batching path: one (1, 224, 224, 3) predict per request."""
+    def call(tensor):
+        data = np.ndarray((1, 224, 224, 3), dtype=np.float32)
+        data[0] = tensor
+        return model.predict(data, verbose=0)[0]
+    return call
+
+
+def run_load(call, inputs, clients, total):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client():
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            call(inputs[i % len(inputs)])
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "req_per_s": total / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+def report(name, stats):
+    print(f"{name:<12} {stats['req_per_s']:>10.1f} req/s   "
+          f"p50 {stats['p50_ms']:>8.2f} ms   p99 {stats['p99_ms']:>8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="./Keras model/personality_model.h5")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--queue-depth", type=int, default=1024)
+    args = parser.parse_args()
+
+    model = load_model(args.model, compile=False)
+    rng = np.random.default_rng(0)
+    inputs = rng.uniform(-1, 1, size=(32, 224, 224, 3)).astype(np.float32)
+
+    # Warm up both code paths so graph tracing is not timed.
+    model.predict(inputs[:1], verbose=0)
+    model.predict_on_batch(inputs[:args.batch_size])
+
+    print(f"clients={args.clients} requests={args.requests} "
+          f"batch_size={args.batch_size} max_wait_ms={args.max_wait_ms}")
+    report("per-request", run_load(per_request_call(model), inputs, args.clients, args.requests))
+
+    predictor = BatchingPredictor(
+        model.predict_on_batch,
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.max_wait_ms,
+        queue_depth=args.queue_depth,
+    ).start()
+    try:
+        report("batched", run_load(predictor.predict, inputs, args.clients, args.requests))
+    finally:
+        predictor.stop()
+
+
+if __name__ == "__main__":
+    main()
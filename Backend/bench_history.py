@@ -0,0 +1,130 @@
+"""Benchmark: per-request insert_one vs. the buffered HistoryWriter.
+
+Writes N analysis-shaped records from concurrent client threads and reports
+records/s and the p50/p99 time a request thread spends on its write. The
+buffered run includes the final drain, so its records/s is end to end.
+
+    python bench_history.py --mongo-uri mongodb://localhost:27017 --clients 16 --records 20000
+    python bench_history.py --mongomock     # no server needed; shows call overhead only
+
+Then exercises the read side: pages through the whole collection with the
+/history cursor and runs the /history/stats aggregation.
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from history import HistoryWriter, ensure_history_indexes, history_page, history_stats
+
+CLASSES = ["0 Agreeableness", "1 Conscientiousness", "2 Extraversion", "3 Neuroticism", "4 Openness"]
+
+
+def make_record(i, now):
+    return {
+        "original_filename": f"image_{i}.jpg",
+        "local_filename": f"{i:08d}_image_{i}.jpg",
+        "image_url": f"http://localhost:5000/uploads/{i:08d}_image_{i}.jpg",
+        "analysis_time": now - timedelta(seconds=random.randint(0, 30 * 24 * 3600)),
+        "user_session": f"10.0.0.{i % 50}",
+        "keras_class": random.choice(CLASSES),
+        "keras_confidence": random.random(),
+        "gemini_caption": "Benchmark caption.",
+    }
+
+
+def run_load(write, total, clients):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+    now = datetime.utcnow()
+
+    def client():
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            record = make_record(i, now)
+            start = time.perf_counter()
+            write(record)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, np.array(latencies) * 1000
+
+
+def report(name, elapsed, lat_ms, total):
+    print(f"{name:<12}{total / elapsed:>12.0f}{np.percentile(lat_ms, 50):>10.3f}"
+          f"{np.percentile(lat_ms, 99):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--mongomock", action="store_true", help="use an in-process mongomock client")
+    parser.add_argument("--database", default="history_bench")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--flush-batch", type=int, default=100)
+    parser.add_argument("--flush-interval-ms", type=float, default=500)
+    args = parser.parse_args()
+
+    if args.mongomock:
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_uri)
+    db = client[args.database]
+
+    print(f"{'mode':<12}{'records/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+
+    db.per_request.drop()
+    ensure_history_indexes(db.per_request)
+    elapsed, lat_ms = run_load(db.per_request.insert_one, args.records, args.clients)
+    report("per-request", elapsed, lat_ms, args.records)
+
+    db.buffered.drop()
+    ensure_history_indexes(db.buffered)
+    writer = HistoryWriter(db.buffered, max_batch=args.flush_batch,
+                           flush_interval=args.flush_interval_ms / 1000)
+    started = time.perf_counter()
+    _, lat_ms = run_load(writer.add, args.records, args.clients)
+    writer.close()
+    elapsed = time.perf_counter() - started
+    report("buffered", elapsed, lat_ms, args.records)
+    stored = db.buffered.count_documents({})
+    if stored != args.records:
+        print(f"WARNING: {stored} of {args.records} buffered records stored")
+
+    started = time.perf_counter()
+    pages, cursor = 0, None
+    while True:
+        _, cursor = history_page(db.buffered, limit=100, cursor=cursor)
+        pages += 1
+        if cursor is None:
+            break
+    elapsed = time.perf_counter() - started
+    print(f"\n/history: {pages} pages of 100 in {elapsed:.2f}s "
+          f"({elapsed / pages * 1000:.2f} ms/page)")
+
+    started = time.perf_counter()
+    stats = history_stats(db.buffered, bucket="day")
+    print(f"/history/stats: {stats['total']} records, {len(stats['buckets'])} buckets "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Load test for /upload_and_analyze and /api/ocr-recognize.
+
+By default the app runs in-process with the stub captioner and mongomock
+standing in for Gemini and MongoDB, so the numbers reflect this code (decode,
+predict, storage, bookkeeping) and are reproducible on any machine. The
+samples/ images are cycled. A few bytes are appended to each one so every
+request misses the result cache, unless --cache-hits is given. mongomock comes
+from requirements-dev.txt.
+
+    python bench_load.py --requests 500 --concurrency 16
+    python bench_load.py --endpoint ocr --caption-delay-ms 300
+    python bench_load.py --url http://127.0.0.1:5000 --requests 2000   # a running server
+    python bench_load.py --max-p99-ms 250 --min-rps 40                 # exit 1 on regression
+
+Prints client-side throughput and latency percentiles. In-process runs also
+print the per-stage breakdown from the app's metrics and, with the quality
+gate on, its skip rate and the estimated request time it saved. Gate
+rejections (422) are counted as answers, not failures.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from io import BytesIO
+
+import numpy as np
+
+ENDPOINTS = {
+    "analyze": ("/upload_and_analyze", "image"),
+    "ocr": ("/api/ocr-recognize", "handwriting_image"),
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_samples(directory):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))
+    if not names:
+        sys.exit(f"no images in {directory}")
+    samples = []
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            samples.append((name, f.read()))
+    return samples
+
+
+def in_process_client(args):
+    """Imports the app with stand-ins for Gemini and MongoDB; returns (post, app module)."""
+    os.environ["CAPTION_BACKEND"] = "stub"
+    os.environ["CAPTION_STUB_DELAY_MS"] = str(args.caption_delay_ms)
+    os.environ.setdefault("UPLOAD_FOLDER", tempfile.mkdtemp(prefix="scry-load-") + os.sep)
+    os.environ.setdefault("FILE_SERVER_BASE_URL", "http://localhost:5000/uploads/")
+    if not args.real_mongo:
+        import flask_pymongo
+        import mongomock
+        flask_pymongo.MongoClient = mongomock.MongoClient
+
+    import app as backend
+    backend.model_loader.start(background=False)
+    if not backend.model_loader.ready:
+        sys.exit(f"model failed to load: {backend.model_loader.error}")
+    client = backend.app.test_client()
+
+    def post(path, field, filename, data):
+        response = client.post(path, data={field: (BytesIO(data), filename)}, content_type="multipart/form-data")
+        return response.status_code
+
+    return post, backend
+
+
+def http_client(base_url):
+    def post(path, field, filename, data):
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        req = urllib.request.Request(
+            base_url.rstrip("/") + path, data=body, method="POST",
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            return 0
+
+    return post
+
+
+def run_load(post, samples, endpoints, total, concurrency, cache_hits, first=0):
+    """Sends requests ``first`` .. ``first + total - 1``; the number picks the
+    sample, the endpoint and the cache-busting suffix."""
+    latencies = {name: [] for name in endpoints}
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(first, first + total))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            endpoint = endpoints[i % len(endpoints)]
+            path, field = ENDPOINTS[endpoint]
+            filename, data = samples[i % len(samples)]
+            if not cache_hits:
+                data = data + i.to_bytes(8, "little")
+            started = time.perf_counter()
+            status = post(path, field, filename, data)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[endpoint].append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, latencies, statuses
+
+
+def percentiles(values):
+    ms = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def stage_table(backend):
+    """Per-stage numbers from the app's histograms (quantiles are bucket estimates)."""
+    rows = []
+    for histogram, kind in ((backend.STAGE_SECONDS, "stage"), (backend.BACKGROUND_SECONDS, "background")):
+        for labels in histogram.series():
+            count, mean, p50, p99 = histogram.summary(**labels)
+            name = f"{labels['handler']}.{labels['stage']}" if kind == "stage" else f"bg.{labels['task']}"
+            rows.append({"name": name, "count": count, "mean_ms": mean * 1000,
+                         "p50_ms": p50 * 1000, "p99_ms": p99 * 1000})
+    return rows
+
+
+def gate_summary(backend):
+    """Quality-gate counters summed over handlers (warm-up included)."""
+    def total(counter, **labels):
+        return sum(counter.value(handler=h, **labels) for h in ("analyze", "bulk"))
+
+    rejected = total(backend.QUALITY_GATE_TOTAL, outcome="rejected")
+    passed = total(backend.QUALITY_GATE_TOTAL, outcome="passed")
+    return {
+        "threshold": backend.QUALITY_GATE_THRESHOLD,
+        "rejected": rejected,
+        "passed": passed,
+        "skip_rate": rejected / (rejected + passed) if rejected + passed else 0.0,
+        "saved_seconds": total(backend.QUALITY_GATE_SAVED),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "samples"))
+    parser.add_argument("--endpoint", choices=["analyze", "ocr", "both"], default="analyze")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--cache-hits", action="store_true", help="send identical bytes (measures the cache path)")
+    parser.add_argument("--caption-delay-ms", type=float, default=0, help="stub Gemini latency (in-process only)")
+    parser.add_argument("--real-mongo", action="store_true",
+                        help="use the app's configured MongoDB instead of mongomock (in-process only)")
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="exit 1 if any endpoint's p99 is above this")
+    parser.add_argument("--min-rps", type=float, help="exit 1 if throughput is below this")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    endpoints = ["analyze", "ocr"] if args.endpoint == "both" else [args.endpoint]
+    backend = None
+    if args.url:
+        post = http_client(args.url)
+    else:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))  # model paths are relative
+        post, backend = in_process_client(args)
+
+    if args.warmup:
+        run_load(post, samples, endpoints, args.warmup, args.concurrency, args.cache_hits)
+    elapsed, latencies, statuses = run_load(post, samples, endpoints, args.requests, args.concurrency,
+                                            args.cache_hits, first=args.warmup)
+
+    results = {
+        "mode": "http" if args.url else "in-process",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seconds": elapsed,
+        "req_per_s": args.requests / elapsed,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "endpoints": {name: percentiles(values) for name, values in latencies.items() if values},
+    }
+
+    print(f"mode={results['mode']} requests={args.requests} concurrency={args.concurrency} "
+          f"cache_hits={args.cache_hits}")
+    print(f"throughput {results['req_per_s']:.1f} req/s in {elapsed:.2f}s, statuses {results['statuses']}")
+    print(f"\n{'endpoint':<10}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, row in results["endpoints"].items():
+        print(f"{name:<10}{row['count']:>7}{row['mean_ms']:>10.1f}{row['p50_ms']:>10.1f}"
+              f"{row['p90_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}")
+
+    if backend is not None:
+        results["stages"] = stage_table(backend)
+        print(f"\n{'stage (incl. warm-up)':<26}{'count':>7}{'mean ms':>10}{'~p50 ms':>10}{'~p99 ms':>10}")
+        for row in results["stages"]:
+            print(f"{row['name']:<26}{row['count']:>7}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+                  f"{row['p99_ms']:>10.2f}")
+        if backend.quality_gate_active():
+            results["quality_gate"] = gate_summary(backend)
+            gate = results["quality_gate"]
+            print(f"\nquality gate (threshold {gate['threshold']}): {gate['rejected']} rejected, "
+                  f"{gate['passed']} passed, skip rate {gate['skip_rate']:.1%}, "
+                  f"~{gate['saved_seconds']:.2f}s of request time saved")
+        backend.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = []
+    if args.max_p99_ms is not None:
+        failed += [f"{name} p99 {row['p99_ms']:.1f} ms > {args.max_p99_ms} ms"
+                   for name, row in results["endpoints"].items() if row["p99_ms"] > args.max_p99_ms]
+    if args.min_rps is not None and results["req_per_s"] < args.min_rps:
+        failed.append(f"throughput {results['req_per_s']:.1f} req/s < {args.min_rps}")
+    bad = sum(v for k, v in statuses.items() if not 200 <= k < 300 and k != 422)
+    if bad:
+        failed.append(f"{bad} non-2xx responses")
+    if failed:
+        print("\nFAILED: " + "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmark: original inline preprocessing vs. preprocessing.py.
+
+Reports per-image time and allocations (tracemalloc peak and block count)
+over the images in ``samples/``.
+
+    python bench_preprocessing.py --images ../samples --repeat 5
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+import numpy as np
+from io import BytesIO
+from PIL import Image, ImageOps
+
+from preprocessing import BufferPool, preprocess, preprocess_batch
+
+
+def legacy(file_bytes):
+    """The code previously inlined in app.py and evaluate.py."""
+    image = Image.open(BytesIO(file_bytes)).convert("RGB")
+    resized = ImageOps.fit(image, (224, 224), Image.Resampling.LANCZOS)
+    arr = np.asarray(resized)
+    normalized = (arr.astype(np.float32) / 127.5) - 1
+    data = np.ndarray((1, 224, 224, 3), dtype=np.float32)
+    data[0] = normalized
+    return data
+
+
+def measure(name, fn, blobs, repeat):
+    fn(blobs[0])  # warm-up
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for blob in blobs:
+            fn(blob)
+    per_image_ms = (time.perf_counter() - start) * 1000 / (repeat * len(blobs))
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for blob in blobs:
+        fn(blob)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+
+    print(f"{name:<22} {per_image_ms:>8.2f} ms/image   peak {peak / 1e6:>7.2f} MB   "
+          f"{blocks:>6} live blocks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default=os.path.join("..", "samples"))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")) +
+                   glob.glob(os.path.join(args.images, "*.png")))
+    if not paths:
+        parser.error(f"no images found in {args.images}")
+    blobs = []
+    for path in paths:
+        with open(path, "rb") as f:
+            blobs.append(f.read())
+    print(f"{len(blobs)} images, repeat={args.repeat}")
+
+    pool = BufferPool(1)
+
+    def pooled(blob, resample="lanczos"):
+        with pool.buffer() as buf:
+            preprocess(blob, out=buf, resample=resample)
+
+    batch = np.empty((len(blobs), 224, 224, 3), dtype=np.float32)
+
+    measure("legacy", legacy, blobs, args.repeat)
+    measure("draft+lanczos", pooled, blobs, args.repeat)
+    measure("draft+bilinear", lambda b: pooled(b, "bilinear"), blobs, args.repeat)
+    measure("no-draft+lanczos", lambda b: preprocess(b, draft=False), blobs, args.repeat)
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        preprocess_batch(blobs, out=batch)
+    per_image_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(blobs))
+    print(f"{'batch api':<22} {per_image_ms:>8.2f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Measures cold start and per-worker memory for serve.py.
+
+Starts serve.py with the given options, polls /healthz until every worker
+reports ready, then prints time-to-listen, time-to-ready and the RSS and PSS
+of each process. PSS splits shared pages between the processes that map them,
+so it shows what --prefork saves; RSS counts shared pages in full for every
+worker. Linux only (reads /proc).
+
+    python bench_startup.py --workers 4
+    python bench_startup.py --workers 4 --prefork
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def memory_mb(pid):
+    """(RSS, PSS) in MB for one process."""
+    rss = pss = None
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) / 1024
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss, pss
+
+
+def children_of(parent):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name may contain spaces.
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def healthz(url):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--prefork", action="store_true")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    cmd = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(args.port),
+           "--workers", str(args.workers)]
+    if args.prefork:
+        cmd.append("--prefork")
+    url = f"http://127.0.0.1:{args.port}/healthz"
+
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    listening = None
+    ready_pids = set()
+    first_ready = None
+    try:
+        while len(ready_pids) < args.workers:
+            if proc.poll() is not None:
+                sys.exit(f"serve.py exited with status {proc.returncode}")
+            if time.perf_counter() - started > args.timeout:
+                sys.exit(f"not ready after {args.timeout:.0f}s ({len(ready_pids)} workers ready)")
+            status, body = healthz(url)
+            now = time.perf_counter() - started
+            if status is not None and listening is None:
+                listening = now
+            if status == 200:
+                ready_pids.add(body["pid"])
+                first_ready = first_ready or now
+            else:
+                time.sleep(0.05)
+        all_ready = time.perf_counter() - started
+
+        mode = "prefork" if args.prefork else "independent"
+        print(f"mode={mode} workers={args.workers}")
+        print(f"listening after   {listening:.2f}s")
+        print(f"first ready after {first_ready:.2f}s")
+        print(f"all ready after   {all_ready:.2f}s")
+
+        processes = [("parent", proc.pid)] + [("worker", pid) for pid in children_of(proc.pid)]
+        if args.workers <= 1:
+            processes = [("server", proc.pid)]
+        total_pss = 0.0
+        print(f"\n{'process':<8}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}")
+        for role, pid in processes:
+            rss, pss = memory_mb(pid)
+            total_pss += pss or 0.0
+            pss_text = f"{pss:.0f}" if pss is not None else "n/a"
+            print(f"{role:<8}{pid:>8}{rss:>10.0f}{pss_text:>10}")
+        print(f"{'total':<8}{'':>8}{'':>10}{total_pss:>10.0f}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Incremental readers for bulk upload request bodies.
+
+``iter_uploads`` yields one (filename, bytes) pair per image as soon as that
+image has arrived, so inference can start while the rest of the body is
+still being received. At most one image is held in memory at a time.
+
+Two body formats are accepted:
+  * multipart/form-data with any number of file parts (non-file fields are
+    ignored); a part that is itself a .zip is expanded;
+  * a raw zip archive (Content-Type application/zip).
+
+A zip's directory sits at the end of the archive, so zips are spooled to a
+temporary file (on disk past ``SPOOL_MEMORY_BYTES``) before their entries are
+read one by one.
+
+A file that cannot be taken on its own (over ``max_file_bytes``, or a zip
+entry that is corrupt, encrypted or uses an unsupported compression) is
+yielded as (filename, ``SkippedUpload``) and the rest of the body is still
+read. A body that cannot be parsed any further raises ``BulkUploadError``.
+"""
+import os
+import tempfile
+import zipfile
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+CHUNK_SIZE = 64 * 1024
+SPOOL_MEMORY_BYTES = 4 * 1024 * 1024
+
+
+class BulkUploadError(ValueError):
+    """Raised for a request body that cannot be read as a bulk upload."""
+
+
+class SkippedUpload(BulkUploadError):
+    """Yielded in place of the bytes of one file that was skipped."""
+
+
+# What ZipFile.read raises for a bad CRC or truncated data, an encrypted
+# entry and an unsupported compression method.
+ZIP_ENTRY_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError)
+
+
+def iter_uploads(stream, content_type, max_file_bytes=None):
+    """Yields (filename, file_bytes or SkippedUpload) for every image in a multipart or zip body."""
+    mimetype, options = parse_options_header(content_type or "")
+    if mimetype == "multipart/form-data":
+        boundary = options.get("boundary")
+        if not boundary:
+            raise BulkUploadError("multipart body without a boundary")
+        yield from _iter_multipart(stream, boundary.encode("latin-1"), max_file_bytes)
+    elif mimetype in ZIP_TYPES:
+        with _spool(stream) as spooled:
+            yield from _iter_zip(spooled, max_file_bytes)
+    else:
+        raise BulkUploadError("expected multipart/form-data or application/zip")
+
+
+def _is_zip(filename, content_type):
+    return (filename or "").lower().endswith(".zip") or content_type in ZIP_TYPES
+
+
+def _next_event(decoder):
+    try:
+        return decoder.next_event()
+    except ValueError as e:  # werkzeug's error for malformed or truncated bodies
+        raise BulkUploadError(f"malformed multipart body: {e}") from None
+
+
+def _iter_multipart(stream, boundary, max_file_bytes):
+    decoder = MultipartDecoder(boundary)
+    part = None  # (filename, is_zip, buffer, size) for the file being received
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        decoder.receive_data(chunk or None)
+        event = _next_event(decoder)
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, File):
+                is_zip = _is_zip(event.filename, event.headers.get("Content-Type"))
+                buffer = (tempfile.SpooledTemporaryFile(SPOOL_MEMORY_BYTES) if is_zip else BytesIO())
+                part = [event.filename or "upload", is_zip, buffer, 0]
+            elif isinstance(event, Field):
+                part = None
+            elif isinstance(event, Data) and part is not None:
+                part[3] += len(event.data)
+                oversized = max_file_bytes and not part[1] and part[3] > max_file_bytes
+                if not oversized:
+                    part[2].write(event.data)
+                if not event.more_data:
+                    filename, is_zip, buffer, _ = part
+                    part = None
+                    if oversized:
+                        # Drop the part, keep reading the others.
+                        yield filename, SkippedUpload(f"{filename} exceeds {max_file_bytes} bytes")
+                    elif is_zip:
+                        with buffer:
+                            buffer.seek(0)
+                            yield from _iter_zip(buffer, max_file_bytes)
+                    else:
+                        yield filename, buffer.getvalue()
+                elif oversized and part[2].tell():
+                    part[2] = BytesIO()  # free what was buffered before the limit
+            event = _next_event(decoder)
+        if isinstance(event, Epilogue):
+            return
+        if not chunk:
+            raise BulkUploadError("multipart body ended before its closing boundary")
+
+
+@contextmanager
+def _spool(stream):
+    """Copies a stream into a SpooledTemporaryFile, chunk by chunk."""
+    with tempfile.SpooledTemporaryFile(SPOOL_MEMORY_BYTES) as spooled:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            spooled.write(chunk)
+        spooled.seek(0)
+        yield spooled
+
+
+def _iter_zip(fileobj, max_file_bytes):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise BulkUploadError(f"invalid zip archive: {e}") from None
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or os.path.basename(name).startswith(".") or "__MACOSX" in name:
+                continue
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            filename = os.path.basename(name)
+            if max_file_bytes and info.file_size > max_file_bytes:
+                yield filename, SkippedUpload(f"{name} exceeds {max_file_bytes} bytes")
+                continue
+            try:
+                data = archive.read(info)
+            except ZIP_ENTRY_ERRORS as e:
+                yield filename, SkippedUpload(f"cannot read {name} from the zip: {e}")
+                continue
+            yield filename, data
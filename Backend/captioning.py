@@ -0,0 +1,249 @@
+"""Bounded, timeout-guarded Gemini captioning.
+
+Caption calls run on a small thread pool so they can overlap local Keras
+inference instead of following it. Every call is limited by a pending-call cap,
+a per-call timeout and a circuit breaker that fails fast while Gemini is down.
+
+The remote client is pluggable: anything with ``caption(image, prompt)`` works,
+so ``StubCaptioner`` can stand in for Gemini in tests and load benchmarks.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from io import BytesIO
+from typing import NamedTuple
+
+# Upload formats Gemini accepts as they are (MPO is a JPEG with extra data).
+GEMINI_MIME_TYPES = {"JPEG": "image/jpeg", "MPO": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class CaptionUnavailableError(Exception):
+    """Raised when a caption call is refused (breaker open or too many pending)."""
+
+
+class ImageBytes(NamedTuple):
+    """Encoded image bytes sent to the captioner as-is (no decode/re-encode)."""
+    data: bytes
+    mime_type: str
+
+
+def gemini_image(image, data):
+    """The upload as ``ImageBytes`` Gemini accepts.
+
+    JPEG, PNG and WEBP uploads are passed through untouched; other formats
+    (BMP, GIF, TIFF, ...) are re-encoded to PNG from the opened ``image``.
+    """
+    mime_type = GEMINI_MIME_TYPES.get(image.format)
+    if mime_type is not None:
+        return ImageBytes(data, mime_type)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+    out = BytesIO()
+    image.save(out, "PNG")
+    return ImageBytes(out.getvalue(), "image/png")
+
+
+class GeminiCaptioner:
+    """Captions images with ``google.genai``.
+
+    Pass a ready ``client``, or an ``api_key`` to have the client (and the
+    google.genai import) created on first use. ``timeout`` (seconds) is set
+    on that client's HTTP requests, so a hung call fails and frees its worker
+    instead of holding it until Gemini answers.
+    """
+
+    def __init__(self, client=None, model="gemini-2.5-flash", api_key=None, timeout=None):
+        self._client = client
+        self._api_key = api_key
+        self.timeout = timeout
+        self.model = model
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import google.genai as genai
+                    from google.genai import types
+                    http_options = None
+                    if self.timeout:
+                        http_options = types.HttpOptions(timeout=int(self.timeout * 1000))  # milliseconds
+                    self._client = genai.Client(api_key=self._api_key, http_options=http_options)
+        return self._client
+
+    def caption(self, image, prompt):
+        if isinstance(image, ImageBytes):
+            from google.genai import types
+            image = types.Part.from_bytes(data=image.data, mime_type=image.mime_type)
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=[image, prompt]
+        )
+        return response.text.strip()
+
+
+class StubCaptioner:
+    """Offline stand-in that returns a fixed caption after an optional delay."""
+
+    def __init__(self, text="Stub caption.", delay_ms=0.0):
+        self.text = text
+        self.delay = delay_ms / 1000.0
+
+    def caption(self, image, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.text
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open, calls are refused until ``reset_timeout`` seconds have passed;
+    then a single trial call is let through (half-open) and its outcome
+    decides whether the breaker closes again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class CaptionService:
+    """Runs captioner calls on a bounded pool with a timeout and breaker."""
+
+    def __init__(self, captioner, max_workers=4, max_pending=16, timeout=20.0, breaker=None):
+        self.captioner = captioner
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="caption")
+
+    def submit(self, image, prompt, wait=None):
+        """Starts a caption call and returns its Future.
+
+        Raises ``CaptionUnavailableError`` if the breaker is open or
+        ``max_pending`` calls are already queued or running. That happens
+        straight away unless ``wait`` gives the seconds to wait for a slot.
+        """
+        if self.captioner is None:
+            raise CaptionUnavailableError("No caption backend configured")
+        acquired = self._slots.acquire(blocking=False) if wait is None else self._slots.acquire(timeout=wait)
+        if not acquired:
+            raise CaptionUnavailableError("Too many caption requests in flight")
+        if not self.breaker.allow():
+            self._slots.release()
+            raise CaptionUnavailableError("Caption service temporarily unavailable (circuit open)")
+        try:
+            future = self._executor.submit(self._call, image, prompt)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the remote call really finishes (or the
+        # future is cancelled), even if the waiting request already gave up,
+        # so the pending cap stays honest.
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _call(self, image, prompt):
+        started = time.monotonic()
+        try:
+            text = self.captioner.caption(image, prompt)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if time.monotonic() - started > self.timeout:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return text
+
+    def result(self, future, timeout=None):
+        """Waits for a submitted call, raising ``TimeoutError`` after the per-call timeout."""
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Caption call exceeded {self.timeout:.0f}s") from None
+
+    def caption(self, image, prompt):
+        """Blocking helper: submit and wait."""
+        return self.result(self.submit(image, prompt))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class JobStore:
+    """In-memory registry of background caption jobs, pruned by age."""
+
+    def __init__(self, ttl_seconds=600.0, max_jobs=10000):
+        self.ttl = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id=None, **fields):
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = dict(fields, status="pending", created=time.monotonic())
+        return job_id
+
+    def finish(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if k != "created"}
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl
+        for job_id in [j for j, job in self._jobs.items() if job["created"] < cutoff]:
+            del self._jobs[job_id]
+        while len(self._jobs) >= self.max_jobs:
+            del self._jobs[next(iter(self._jobs))]
@@ -0,0 +1,83 @@
+"""Exports the Keras models to float and int8 TFLite for the inference backends.
+
+The int8 model is calibrated with a representative dataset drawn from a
+local image folder, preprocessed exactly as the API does it. Inputs and
+outputs stay float32 so every backend is a drop-in replacement for the others.
+
+Also exports the fused personality + detection graph used when the quality
+gate is on (``Keras model/fused_model.{float,int8}.tflite``).
+
+    python export_tflite.py --calibration ../samples
+    python export_tflite.py --models "./Keras model/personality_model.h5" --calibration ../images
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from inference_backends import build_fused_model, fused_path, load_keras_model, tflite_path
+from preprocessing import preprocess
+
+PERSONALITY_MODEL = "./Keras model/personality_model.h5"
+DETECTION_MODEL = "./Keras model/detection model/keras_model.h5"
+DEFAULT_MODELS = [PERSONALITY_MODEL, DETECTION_MODEL]
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def calibration_images(folder, limit):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+    paths = sorted(paths)[:limit]
+    if not paths:
+        raise SystemExit(f"No calibration images found in {folder}")
+    return paths
+
+
+def representative_dataset(paths):
+    def generate():
+        for path in paths:
+            yield [preprocess(path)[np.newaxis]]
+    return generate
+
+
+def convert(model, calibration=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset(calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--calibration", default=os.path.join("..", "samples"),
+                        help="folder of representative images for int8 calibration")
+    parser.add_argument("--calibration-limit", type=int, default=200)
+    parser.add_argument("--no-fused", action="store_true",
+                        help="skip the fused personality + detection export")
+    args = parser.parse_args()
+
+    paths = calibration_images(args.calibration, args.calibration_limit)
+    print(f"Calibrating int8 models on {len(paths)} images from {args.calibration}")
+
+    exports = [(path, load_keras_model(path), path) for path in args.models]
+    if not args.no_fused:
+        fused = build_fused_model(PERSONALITY_MODEL, DETECTION_MODEL)
+        exports.append(("fused personality + detection", fused, fused_path(PERSONALITY_MODEL)))
+
+    for label, model, model_path in exports:
+        for kind, calibration in (("tflite-float", None), ("tflite-int8", paths)):
+            out_path = tflite_path(model_path, kind)
+            data = convert(model, calibration)
+            with open(out_path, "wb") as f:
+                f.write(data)
+            print(f"{label} -> {out_path} ({len(data) / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Analysis history: buffered writes, indexes and the read-side queries.
+
+Writes go through ``HistoryWriter``, a write-behind buffer flushed with
+``insert_many`` when it reaches ``max_batch`` records or every
+``flush_interval`` seconds, whichever comes first, and drained on shutdown.
+Record ids are assigned client-side so callers can refer to a record (for
+example to fill in a caption later) before it has been flushed.
+
+Reads use keyset ("cursor") pagination on (analysis_time, _id) and
+aggregation pipelines that start with an indexed ``$match``.
+"""
+import base64
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+DUPLICATE_KEY = 11000
+
+# (analysis_time, _id) serves the unfiltered timeline and its cursor; the
+# compound indexes serve per-class and per-session filters (and, as prefixes,
+# plain lookups on keras_class or user_session).
+HISTORY_INDEXES = [
+    [("analysis_time", DESCENDING), ("_id", DESCENDING)],
+    [("keras_class", ASCENDING), ("analysis_time", DESCENDING)],
+    [("user_session", ASCENDING), ("analysis_time", DESCENDING)],
+]
+
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%dT%H:00",
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+
+
+def ensure_history_indexes(collection):
+    for keys in HISTORY_INDEXES:
+        try:
+            collection.create_index(keys)
+        except PyMongoError as e:
+            print(f"Warning: could not create history index {keys}: {e}")
+
+
+class HistoryWriter:
+    """Write-behind buffer in front of the analysis_history collection."""
+
+    def __init__(self, collection, max_batch=100, flush_interval=0.5, max_buffer=10000, observe=None):
+        self.collection = collection
+        self.observe = observe  # optional observe(task, seconds) for flush latency
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.flushed = 0
+        self.failed = 0
+        self.last_error = None
+        self._buffer = []
+        self._by_id = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def add(self, record):
+        """Queues one record and returns its ``_id``."""
+        return self.add_many([record])[0]
+
+    def add_many(self, records):
+        for record in records:
+            record.setdefault("_id", ObjectId())
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        with self._cond:
+            self._buffer.extend(records)
+            for record in records:
+                self._by_id[record["_id"]] = record
+            full = len(self._buffer) >= self.max_buffer
+            if len(self._buffer) >= self.max_batch:
+                self._cond.notify()
+        if full:
+            # Mongo is not keeping up: make the caller pay for a flush rather
+            # than growing without bound.
+            self.flush()
+        return [record["_id"] for record in records]
+
+    def update(self, record_id, fields):
+        """``$set`` on a record, whether it is still buffered or already stored."""
+        # Holding the flush lock means a record is either still in the buffer
+        # or fully written, never half way between the two.
+        with self._flush_lock:
+            with self._cond:
+                record = self._by_id.get(record_id)
+                if record is not None:
+                    record.update(fields)
+                    return
+        try:
+            self.collection.update_one({"_id": record_id}, {"$set": fields})
+        except DuplicateKeyError:
+            # Another record already owns this digest; keep the rest.
+            fields = {k: v for k, v in fields.items() if k != "file_digest"}
+            self.collection.update_one({"_id": record_id}, {"$set": fields})
+
+    def find(self, record_id):
+        """Returns a copy of a buffered record, or None once it has been flushed."""
+        with self._cond:
+            record = self._by_id.get(record_id)
+            return dict(record) if record is not None else None
+
+    def pending(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "last_error": str(self.last_error) if self.last_error else None,
+        }
+
+    def flush(self):
+        """Writes everything buffered so far with one insert_many."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            try:
+                self.collection.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                self._retry_duplicates(batch, e.details.get("writeErrors", []))
+            except PyMongoError as e:
+                self._requeue(batch, e)
+                return 0
+            with self._cond:
+                for record in batch:
+                    self._by_id.pop(record["_id"], None)
+            self.last_error = None
+            self.flushed += len(batch)
+            if self.observe is not None:
+                self.observe("history_flush", time.perf_counter() - started)
+            return len(batch)
+
+    def _retry_duplicates(self, batch, errors):
+        for error in errors:
+            if error.get("code") != DUPLICATE_KEY:
+                self.failed += 1
+                print(f"History insert failed: {error.get('errmsg')}")
+                continue
+            record = batch[error["index"]]
+            if "file_digest" not in error.get("keyPattern", {"file_digest": 1}):
+                continue  # same _id: already stored by an earlier attempt
+            # The digest is already owned by another record; store this one
+            # without it so it still shows up in the history.
+            record.pop("file_digest", None)
+            try:
+                self.collection.insert_one(record)
+            except PyMongoError as e:
+                self.failed += 1
+                print(f"History insert failed: {e}")
+
+    def _requeue(self, batch, error):
+        print(f"History flush failed, will retry: {error}")
+        self.last_error = error
+        with self._cond:
+            room = self.max_buffer - len(self._buffer)
+            if room < len(batch):
+                dropped = batch[room:] if room > 0 else batch
+                batch = batch[:max(room, 0)]
+                self.failed += len(dropped)
+                for record in dropped:
+                    self._by_id.pop(record["_id"], None)
+                print(f"History buffer full, dropped {len(dropped)} records")
+            self._buffer[:0] = batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._buffer) < self.max_batch:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+            if self.last_error is not None:
+                time.sleep(self.flush_interval)  # back off while Mongo is failing
+
+    def close(self, timeout=10.0):
+        """Stops the flush thread after draining the buffer."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush()
+
+
+# --- Read side ---
+def encode_cursor(record):
+    raw = f"{record['analysis_time'].isoformat()}|{record['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns (analysis_time, _id) or raises ValueError."""
+    try:
+        time_text, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(time_text), ObjectId(oid)
+    except Exception:
+        raise ValueError("invalid cursor") from None
+
+
+def history_filter(keras_class=None, user_session=None):
+    query = {}
+    if keras_class:
+        query["keras_class"] = keras_class
+    if user_session:
+        query["user_session"] = user_session
+    return query
+
+
+def history_page(collection, limit=20, cursor=None, keras_class=None, user_session=None):
+    """Returns (records, next_cursor), newest first."""
+    query = history_filter(keras_class, user_session)
+    if cursor:
+        after_time, after_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"analysis_time": {"$lt": after_time}},
+            {"analysis_time": after_time, "_id": {"$lt": after_id}},
+        ]
+    docs = list(
+        collection.find(query)
+        .sort([("analysis_time", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def history_stats(collection, bucket="day", since=None, until=None, keras_class=None, user_session=None):
+    """Class distribution and mean confidence per time bucket."""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=30)
+    match = history_filter(keras_class, user_session)
+    match["analysis_time"] = {"$gte": since, "$lt": until}
+
+    pipeline = [
+        {"$match": match},
+        {"$facet": {
+            "classes": [
+                {"$group": {
+                    "_id": "$keras_class",
+                    "count": {"$sum": 1},
+                    "mean_confidence": {"$avg": "$keras_confidence"},
+                }},
+                {"$sort": {"count": -1}},
+            ],
+            "buckets": [
+                {"$group": {
+                    "_id": {"$dateToString": {"format": BUCKET_FORMATS[bucket], "date": "$analysis_time"}},
+                    "count": {"$sum": 1},
+                    "mean_confidence": {"$avg": "$keras_confidence"},
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+    result = next(iter(collection.aggregate(pipeline)), {"classes": [], "buckets": []})
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "bucket": bucket,
+        "total": sum(c["count"] for c in result["classes"]),
+        "classes": [
+            {"class": c["_id"], "count": c["count"], "mean_confidence": c["mean_confidence"]}
+            for c in result["classes"]
+        ],
+        "buckets": [
+            {"bucket": b["_id"], "count": b["count"], "mean_confidence": b["mean_confidence"]}
+            for b in result["buckets"]
+        ],
+    }
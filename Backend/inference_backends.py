@@ -0,0 +1,192 @@
+"""Interchangeable CPU inference backends for the Keras models.
+
+All backends take a float32 (n, 224, 224, 3) batch normalized to [-1, 1] and
+return an (n, classes) score array, so the batcher does not care which one
+is running.
+
+  keras        the original .h5 model through Keras/TensorFlow;
+  tflite-float the model converted by export_tflite.py, float32;
+  tflite-int8  the same, with int8 weights and activations calibrated on a
+               representative image folder.
+
+The TFLite backends use ``tflite_runtime`` when it is installed, so a worker
+serving them never has to import TensorFlow. They run fixed batch sizes
+(see TFLiteBackend), so tensors are allocated once, at load.
+
+With a detector, every backend serves one fused graph instead: the
+personality scores followed by the detection scores, concatenated into a
+single (n, classes + detector classes) array, from one predict call.
+``backend.fused`` tells which kind was loaded: a TFLite backend whose fused
+export is missing falls back to the plain model.
+"""
+import os
+import threading
+
+import numpy as np
+
+BACKENDS = ("keras", "tflite-float", "tflite-int8")
+FUSED_MODEL_NAME = "fused_model.h5"  # never written; names the fused .tflite files
+
+
+def load_keras_model(path):
+    """Loads an .h5 model, tolerating Teachable Machine exports.
+
+    Teachable Machine saves DepthwiseConv2D with a ``groups`` argument that
+    newer Keras versions reject, so it is dropped on load.
+    """
+    from keras.layers import DepthwiseConv2D
+    from keras.models import load_model
+
+    class CompatDepthwiseConv2D(DepthwiseConv2D):
+        def __init__(self, *args, groups=None, **kwargs):
+            super().__init__(*args, **kwargs)
+
+    return load_model(path, compile=False,
+                      custom_objects={"DepthwiseConv2D": CompatDepthwiseConv2D})
+
+
+def tflite_path(model_path, kind):
+    """``foo/model.h5`` -> ``foo/model.float.tflite`` / ``foo/model.int8.tflite``."""
+    suffix = kind.split("-", 1)[1]
+    return f"{os.path.splitext(model_path)[0]}.{suffix}.tflite"
+
+
+def fused_path(model_path):
+    """Where export_tflite.py puts the fused graph: next to the primary model."""
+    return os.path.join(os.path.dirname(model_path), FUSED_MODEL_NAME)
+
+
+def shares_trunk(a, b):
+    """True when two Teachable Machine models have the same feature extractor.
+
+    Those exports are Sequential([feature_extractor, head]); projects trained
+    from the same base ship bit-identical extractors.
+    """
+    if len(a.layers) != 2 or len(b.layers) != 2:
+        return False
+    wa, wb = a.layers[0].get_weights(), b.layers[0].get_weights()
+    return len(wa) == len(wb) and all(
+        x.shape == y.shape and np.array_equal(x, y) for x, y in zip(wa, wb)
+    )
+
+
+def build_fused_model(model_path, detector_path):
+    """One graph on a shared input whose output is [model scores | detector scores].
+
+    When the two models share their feature extractor (the bundled ones do),
+    it runs once and only the small classification heads are separate, so the
+    detector costs almost nothing on top of the personality model. Otherwise
+    both full models run side by side inside the one graph.
+    """
+    import keras
+
+    primary = load_keras_model(model_path)
+    detector = load_keras_model(detector_path)
+    inputs = keras.Input(shape=primary.input_shape[1:])
+    if shares_trunk(primary, detector):
+        features = primary.layers[0](inputs)
+        outputs = [primary.layers[1](features), detector.layers[1](features)]
+    else:
+        print("Detector does not share the feature extractor; running both models in full")
+        outputs = [primary(inputs), detector(inputs)]
+    return keras.Model(inputs, keras.layers.Concatenate(name="scores")(outputs), name="fused")
+
+
+class KerasBackend:
+    def __init__(self, model_path, detector_path=None):
+        self.name = "keras"
+        self.fused = bool(detector_path)
+        if detector_path:
+            self.model = build_fused_model(model_path, detector_path)
+        else:
+            self.model = load_keras_model(model_path)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class _SizedInterpreter:
+    """One interpreter allocated for a fixed batch size, with a pad buffer."""
+
+    def __init__(self, Interpreter, model_path, num_threads, size):
+        self.size = size
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        details = self.interpreter.get_input_details()[0]
+        self.input_index = details["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        shape = [size, *details["shape"][1:]]
+        self.interpreter.resize_tensor_input(self.input_index, shape)
+        self.interpreter.allocate_tensors()
+        self.padded = np.zeros(shape, dtype=np.float32)
+        # The interpreter keeps per-instance tensor state.
+        self.lock = threading.Lock()
+
+    def predict(self, batch):
+        n = len(batch)
+        with self.lock:
+            if n < self.size:
+                self.padded[:n] = batch  # rows past n are ignored
+                batch = self.padded
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index)[:n].copy()
+
+
+class TFLiteBackend:
+    """Runs a .tflite model at the fixed batch sizes in ``batch_sizes``.
+
+    Each size has its own interpreter, allocated once. A batch runs on the
+    smallest one that holds it, padded up to that size; batches larger than
+    the biggest size are split. So predict never re-allocates tensors, and
+    the batcher and the bulk endpoint do not take turns on one interpreter.
+    """
+
+    def __init__(self, model_path, kind="tflite-float", num_threads=None, batch_sizes=(1,), fused=False):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.name = kind
+        self.fused = fused
+        self.batch_sizes = tuple(sorted(set(batch_sizes)))
+        self._interpreters = [
+            _SizedInterpreter(Interpreter, model_path, num_threads, size) for size in self.batch_sizes
+        ]
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        largest = self._interpreters[-1]
+        if len(batch) > largest.size:
+            return np.concatenate([
+                largest.predict(batch[i:i + largest.size]) for i in range(0, len(batch), largest.size)
+            ])
+        interpreter = next(i for i in self._interpreters if i.size >= len(batch))
+        return interpreter.predict(batch)
+
+
+def load_backend(kind, model_path, num_threads=None, detector_path=None, batch_sizes=(1,)):
+    """Builds the backend named ``kind`` for the .h5 model at ``model_path``.
+
+    With ``detector_path`` the backend serves the fused model/detector graph;
+    for TFLite, if that export is missing, it warns and serves the plain model
+    (``fused`` False). ``batch_sizes`` are the fixed sizes a TFLite backend
+    runs at.
+    """
+    if kind == "keras":
+        return KerasBackend(model_path, detector_path)
+    if kind in ("tflite-float", "tflite-int8"):
+        path = tflite_path(model_path, kind)
+        fused = False
+        if detector_path:
+            fused_file = tflite_path(fused_path(model_path), kind)
+            if os.path.exists(fused_file):
+                path, fused = fused_file, True
+            else:
+                print(f"WARNING: {fused_file} not found, serving {path} without the detector "
+                      f"(quality gate inactive); run export_tflite.py to build it")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run export_tflite.py first")
+        return TFLiteBackend(path, kind, num_threads, batch_sizes, fused)
+    raise ValueError(f"Unknown inference backend '{kind}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,90 @@
+"""Loads the inference model off the request path and tracks readiness.
+
+Loading is split in two steps so a pre-fork server can do the expensive part
+(reading weights) once in the parent and the warm-up (first predict, thread
+pools, network clients) in each worker after fork:
+
+    cold -> loading -> loaded -> warming -> ready
+                   \\-> failed
+"""
+import threading
+import time
+
+
+class ModelLoader:
+    """Runs ``load_fn`` once, then ``warm_up_fn(value)``, and reports progress."""
+
+    def __init__(self, load_fn, warm_up_fn=None):
+        self._load_fn = load_fn
+        self._warm_up_fn = warm_up_fn
+        self.value = None
+        self.status = "cold"
+        self.error = None
+        self.load_seconds = None
+        self.warm_up_seconds = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self, background=True, warm_up=True):
+        """Starts loading unless already started. Safe to call on every request."""
+        with self._lock:
+            if self.status != "cold":
+                return self
+            self.status = "loading"
+        if background:
+            threading.Thread(target=self._load, args=(warm_up,), name="model-loader", daemon=True).start()
+        else:
+            self._load(warm_up)
+        return self
+
+    def _load(self, warm_up):
+        started = time.perf_counter()
+        try:
+            self.value = self._load_fn()
+        except Exception as e:
+            self._fail(e)
+            return
+        self.load_seconds = time.perf_counter() - started
+        self.status = "loaded"
+        if warm_up:
+            self.warm_up()
+
+    def warm_up(self):
+        """Runs the warm-up step on a loaded model and marks it ready."""
+        with self._lock:
+            if self.status != "loaded":
+                return
+            self.status = "warming"
+        started = time.perf_counter()
+        try:
+            if self._warm_up_fn is not None:
+                self._warm_up_fn(self.value)
+        except Exception as e:
+            self._fail(e)
+            return
+        self.warm_up_seconds = time.perf_counter() - started
+        self.status = "ready"
+        self._done.set()
+
+    def _fail(self, error):
+        print(f"ERROR loading model: {error}")
+        self.error = error
+        self.status = "failed"
+        self._done.set()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def wait(self, timeout=None):
+        """Blocks until ready or failed; returns True when ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def info(self):
+        return {
+            "status": self.status,
+            "load_seconds": self.load_seconds,
+            "warm_up_seconds": self.warm_up_seconds,
+            "error": str(self.error) if self.error else None,
+        }
@@ -0,0 +1,148 @@
+"""Content-hash result cache for analysis and OCR responses.
+
+Two tiers:
+  * an in-process LRU bounded by entry count, approximate byte size and TTL;
+  * a persistent tier in MongoDB, looked up by a unique ``file_digest`` field.
+
+Identical uploads (retries, canvas re-submits, demo samples) are answered from
+the cache without decoding the image, running Keras or calling Gemini.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+
+def file_digest(file_bytes):
+    """Returns the hex SHA-256 digest used as the cache key for an upload."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with a TTL and entry-count/byte-size limits."""
+
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self._bytes -= size
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+class ResultCache:
+    """Memory LRU in front of a Mongo collection keyed by ``file_digest``."""
+
+    def __init__(self, name, collection, fields, memory=None):
+        self.name = name
+        self.collection = collection
+        self.fields = fields
+        self.memory = memory or LRUCache()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def ensure_index(self):
+        """Creates the unique digest index; records without a digest are skipped."""
+        try:
+            self.collection.create_index("file_digest", unique=True, sparse=True)
+        except PyMongoError as e:
+            print(f"Warning: could not create file_digest index for {self.name}: {e}")
+
+    def _count(self, attr):
+        with self._stats_lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, digest):
+        value = self.memory.get(digest)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        try:
+            projection = {field: 1 for field in self.fields}
+            projection["_id"] = 0
+            doc = self.collection.find_one({"file_digest": digest}, projection)
+        except PyMongoError as e:
+            print(f"Cache lookup failed for {self.name}: {e}")
+            doc = None
+
+        if doc is None:
+            self._count("misses")
+            return None
+
+        value = {field: doc.get(field) for field in self.fields}
+        self.memory.put(digest, value)
+        self._count("persistent_hits")
+        return value
+
+    def put(self, digest, value, persist=False):
+        """Stores a result in memory and, if ``persist``, in the collection too.
+
+        Callers whose own record already carries ``file_digest`` (the analysis
+        history) leave ``persist`` off; the insert is the persistent tier.
+        """
+        self.memory.put(digest, value)
+        if not persist:
+            return
+        try:
+            self.collection.update_one(
+                {"file_digest": digest},
+                {"$setOnInsert": dict(value, file_digest=digest)},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass
+        except PyMongoError as e:
+            print(f"Cache write failed for {self.name}: {e}")
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.memory_hits + self.persistent_hits + self.misses
+            hits = self.memory_hits + self.persistent_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory.size_bytes,
+            }
@@ -0,0 +1,138 @@
+"""Production entry point for the Scry backend.
+
+    python serve.py --port 5000                         # one process, model loads in the background
+    python serve.py --port 5000 --workers 4             # four workers, each loads its own model
+    python serve.py --port 5000 --workers 4 --prefork   # model loaded once, shared copy-on-write
+
+The listening socket opens immediately and workers serve from the start:
+/healthz answers 503 until the model is loaded and warmed up with a real
+predict.
+
+With --prefork the parent loads the weights before forking, then freezes the
+GC so collections in the workers do not touch (and un-share) those pages.
+Connections that arrive during that load wait in the listen backlog. Each
+worker warms up on a background thread after fork, because thread pools, the
+batcher thread, Mongo connections and the Gemini client must not cross a fork.
+--prefork needs a TFLite backend (INFERENCE_BACKEND=tflite-float /
+tflite-int8) served by tflite_runtime: TensorFlow's runtime is not fork-safe
+once it is loaded, so --prefork is refused with the keras backend, and also
+when loading the model imported TensorFlow (the TFLite backends fall back to
+tf.lite when tflite_runtime is not installed).
+
+On SIGTERM every process drains its buffered history writes before exiting.
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+
+def exit_on_sigterm(signum, frame):
+    sys.exit(0)
+
+
+def serve_worker(server, backend):
+    # The parent forwards Ctrl-C as SIGTERM; exit through the finally block
+    # so buffered history writes are flushed.
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        try:
+            backend.shutdown()
+        finally:
+            # Skip the parent's atexit handlers and any other inherited state.
+            os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Scry backend.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--prefork", action="store_true",
+                        help="load the model in the parent before forking workers")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    import app as backend
+    print(f"Imported app in {time.perf_counter() - started:.2f}s")
+
+    if args.prefork and args.workers > 1 and backend.INFERENCE_BACKEND == "keras":
+        sys.exit("--prefork would fork TensorFlow after loading it, which is not fork-safe. "
+                 "Use INFERENCE_BACKEND=tflite-float or tflite-int8, or drop --prefork.")
+
+    server = make_server(args.host, args.port, backend.app, threaded=True)
+    print(f"Listening on http://{args.host}:{args.port} ({args.workers} worker(s))")
+
+    if args.workers <= 1:
+        backend.model_loader.start(background=True)
+        signal.signal(signal.SIGTERM, exit_on_sigterm)  # runs app.shutdown via atexit
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not hasattr(os, "fork"):
+        sys.exit("--workers > 1 needs os.fork (Linux/macOS)")
+
+    if args.prefork:
+        backend.model_loader.start(background=False, warm_up=False)
+        if backend.model_loader.status == "failed":
+            sys.exit(1)
+        if "tensorflow" in sys.modules:
+            sys.exit("--prefork: loading the model imported TensorFlow, which is not fork-safe. "
+                     "Install tflite-runtime so the TFLite backend does not need it, or drop --prefork.")
+        print(f"Model loaded in parent in {backend.model_loader.load_seconds:.2f}s")
+        gc.freeze()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            if args.prefork:
+                # Serve (503 on /healthz) while warming up, not after.
+                threading.Thread(target=backend.model_loader.warm_up, name="model-warm-up",
+                                 daemon=True).start()
+            else:
+                backend.model_loader.start(background=True)
+            serve_worker(server, backend)
+        return pid
+
+    workers = {spawn() for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; restarting")
+            workers.add(spawn())
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The backend modules are flat files in Backend/, imported by name.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """The Flask app module, against mongomock and a temporary upload folder."""
+    import flask_pymongo
+    import mongomock
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("UPLOAD_FOLDER", str(tmp_path_factory.mktemp("uploads")) + os.sep)
+        patch.setenv("FILE_SERVER_BASE_URL", "http://files.test/uploads/")
+        patch.setenv("CAPTION_BACKEND", "stub")
+        patch.setattr(flask_pymongo, "MongoClient", mongomock.MongoClient)
+        import app
+    return app
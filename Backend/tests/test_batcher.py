@@ -0,0 +1,103 @@
+"""BatchingPredictor: batching, errors, queue limits and shutdown."""
+import threading
+from concurrent.futures import wait
+
+import numpy as np
+import pytest
+
+from batcher import BatchingPredictor, QueueFullError
+
+SHAPE = (2, 2, 1)
+
+
+def tensor(value):
+    return np.full(SHAPE, value, dtype=np.float32)
+
+
+class RecordingModel:
+    """Returns each row's first pixel as its score and records batch sizes."""
+
+    def __init__(self, gate=None):
+        self.batch_sizes = []
+        self.gate = gate
+
+    def __call__(self, batch):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batch_sizes.append(len(batch))
+        return batch.reshape(len(batch), -1)[:, :1].copy()
+
+
+def test_concurrent_requests_share_one_batch():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    predictor = BatchingPredictor(model, max_batch_size=4, max_wait_ms=50, input_shape=SHAPE).start()
+    try:
+        # The first call blocks in the model; the next four queue up behind it.
+        futures = [predictor.submit(tensor(i)) for i in range(5)]
+        gate.set()
+        wait(futures, timeout=5)
+        assert [float(f.result()[0]) for f in futures] == [0, 1, 2, 3, 4]
+        assert sum(model.batch_sizes) == 5
+        assert max(model.batch_sizes) == 4
+    finally:
+        predictor.stop(timeout=5)
+
+
+def test_model_error_fails_the_whole_batch():
+    def broken(batch):
+        raise RuntimeError("boom")
+
+    predictor = BatchingPredictor(broken, max_batch_size=2, input_shape=SHAPE).start()
+    try:
+        with pytest.raises(RuntimeError, match="boom"):
+            predictor.predict(tensor(1), timeout=5)
+        # The worker survives and keeps serving.
+        predictor.predict_fn = RecordingModel()
+        assert float(predictor.predict(tensor(7), timeout=5)[0]) == 7
+    finally:
+        predictor.stop(timeout=5)
+
+
+def test_full_queue_rejects_without_blocking():
+    gate = threading.Event()
+    predictor = BatchingPredictor(RecordingModel(gate), max_batch_size=1, queue_depth=1, input_shape=SHAPE)
+    predictor.start()
+    try:
+        first = predictor.submit(tensor(0))
+        # Wait until the worker has taken the first item into the model.
+        while predictor.qsize():
+            pass
+        second = predictor.submit(tensor(1))
+        with pytest.raises(QueueFullError):
+            predictor.submit(tensor(2))
+        gate.set()
+        wait([first, second], timeout=5)
+        assert float(second.result()[0]) == 1
+    finally:
+        predictor.stop(timeout=5)
+
+
+def test_cancelled_request_is_skipped():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    predictor = BatchingPredictor(model, max_batch_size=1, input_shape=SHAPE).start()
+    try:
+        first = predictor.submit(tensor(0))
+        cancelled = predictor.submit(tensor(1))
+        assert cancelled.cancel()
+        last = predictor.submit(tensor(2))
+        gate.set()
+        assert float(last.result(timeout=5)[0]) == 2
+        assert first.done()
+        assert model.batch_sizes == [1, 1]
+    finally:
+        predictor.stop(timeout=5)
+
+
+def test_stop_finishes_queued_requests():
+    predictor = BatchingPredictor(RecordingModel(), max_batch_size=2, max_wait_ms=1, input_shape=SHAPE)
+    futures = [predictor.submit(tensor(i)) for i in range(5)]
+    predictor.stop(timeout=5)
+    assert all(f.done() for f in futures)
+    assert [float(f.result()[0]) for f in futures] == [0, 1, 2, 3, 4]
@@ -0,0 +1,135 @@
+"""iter_uploads: multipart and zip bodies, limits and incremental reads."""
+import zipfile
+from io import BytesIO
+
+import pytest
+
+import bulk
+from bulk import BulkUploadError, SkippedUpload, iter_uploads
+
+BOUNDARY = "test-boundary"
+MULTIPART = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def multipart(*parts):
+    """parts: (field name, filename or None, bytes, content type)."""
+    body = b""
+    for name, filename, data, content_type in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += (f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n"
+                 f"Content-Type: {content_type}\r\n\r\n").encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def zip_bytes(entries):
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+class CountingStream(BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Split every part across many reads.
+    monkeypatch.setattr(bulk, "CHUNK_SIZE", 7)
+
+
+def test_multipart_files_in_order_fields_ignored(small_chunks):
+    body = multipart(
+        ("note", None, b"not a file", "text/plain"),
+        ("images", "a.jpg", b"A" * 100, "image/jpeg"),
+        ("images", "b.png", b"\r\n--almost-a-boundary\r\n", "image/png"),
+    )
+    assert list(iter_uploads(BytesIO(body), MULTIPART)) == [
+        ("a.jpg", b"A" * 100),
+        ("b.png", b"\r\n--almost-a-boundary\r\n"),
+    ]
+
+
+def test_zip_part_is_expanded(small_chunks):
+    archive = zip_bytes({"x/one.jpg": b"1", "two.png": b"2", "readme.txt": b"skip", "__MACOSX/._one.jpg": b"skip"})
+    body = multipart(
+        ("images", "first.jpg", b"0", "image/jpeg"),
+        ("images", "batch.zip", archive, "application/zip"),
+    )
+    assert list(iter_uploads(BytesIO(body), MULTIPART)) == [
+        ("first.jpg", b"0"), ("one.jpg", b"1"), ("two.png", b"2"),
+    ]
+
+
+def test_raw_zip_body():
+    archive = zip_bytes({"one.jpg": b"1", "dir/.hidden.jpg": b"skip", "two.JPEG": b"2"})
+    assert list(iter_uploads(BytesIO(archive), "application/zip")) == [("one.jpg", b"1"), ("two.JPEG", b"2")]
+
+
+def test_first_image_arrives_before_the_body_is_read():
+    body = multipart(*[("images", f"{i}.jpg", bytes([i]) * 200_000, "image/jpeg") for i in range(5)])
+    stream = CountingStream(body)
+    uploads = iter_uploads(stream, MULTIPART)
+    filename, _ = next(uploads)
+    assert filename == "0.jpg"
+    assert stream.bytes_read < len(body) / 2
+    assert len(list(uploads)) == 4
+
+
+def test_oversized_file_is_skipped_not_fatal(small_chunks):
+    body = multipart(
+        ("images", "a.jpg", b"a" * 100, "image/jpeg"),
+        ("images", "big.jpg", b"x" * 101, "image/jpeg"),
+        ("images", "b.jpg", b"b" * 10, "image/jpeg"),
+    )
+    uploads = list(iter_uploads(BytesIO(body), MULTIPART, max_file_bytes=100))
+    assert [name for name, _ in uploads] == ["a.jpg", "big.jpg", "b.jpg"]
+    assert isinstance(uploads[1][1], SkippedUpload)
+    assert "exceeds 100 bytes" in str(uploads[1][1])
+    assert uploads[2] == ("b.jpg", b"b" * 10)
+
+    archive = zip_bytes({"big.jpg": b"x" * 101, "ok.jpg": b"1"})
+    uploads = list(iter_uploads(BytesIO(archive), "application/zip", max_file_bytes=100))
+    assert isinstance(uploads[0][1], SkippedUpload)
+    assert uploads[1] == ("ok.jpg", b"1")
+
+
+def test_corrupt_zip_entry_is_skipped():
+    archive = bytearray(zip_bytes({"bad.jpg": b"payload-bytes", "ok.jpg": b"1"}))
+    at = archive.index(b"payload-bytes")
+    archive[at:at + 7] = b"PAYLOAD"  # same length, wrong CRC
+    uploads = list(iter_uploads(BytesIO(bytes(archive)), "application/zip"))
+    assert uploads[0][0] == "bad.jpg"
+    assert isinstance(uploads[0][1], SkippedUpload)
+    assert uploads[1] == ("ok.jpg", b"1")
+
+
+def test_truncated_multipart_raises_after_complete_files(small_chunks):
+    body = multipart(
+        ("images", "a.jpg", b"a" * 50, "image/jpeg"),
+        ("images", "b.jpg", b"b" * 50, "image/jpeg"),
+    )
+    uploads = iter_uploads(BytesIO(body[:-60]), MULTIPART)
+    assert next(uploads) == ("a.jpg", b"a" * 50)
+    with pytest.raises(BulkUploadError):
+        list(uploads)
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"not a zip", "application/zip"),
+    (f"--{BOUNDARY}\r\nno-disposition: x\r\n\r\ndata".encode(), MULTIPART),
+    (multipart(("images", "a.jpg", b"a", "image/jpeg"))[:-10], MULTIPART),
+    (b"", "multipart/form-data"),
+    (b"", "text/plain"),
+])
+def test_bad_bodies(body, content_type):
+    with pytest.raises(BulkUploadError):
+        list(iter_uploads(BytesIO(body), content_type))
@@ -0,0 +1,174 @@
+"""CircuitBreaker, CaptionService limits, the Gemini client timeout and payload."""
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import captioning
+from captioning import (
+    CaptionService, CaptionUnavailableError, CircuitBreaker, GeminiCaptioner, ImageBytes, StubCaptioner,
+    gemini_image,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(captioning.time, "monotonic", lambda: now[0])
+    return now
+
+
+class BlockingCaptioner:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def caption(self, image, prompt):
+        self.release.wait(5)
+        return "done"
+
+
+class FailingCaptioner:
+    def caption(self, image, prompt):
+        raise RuntimeError("gemini down")
+
+
+# --- CircuitBreaker ---
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # resets the streak
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 29
+    assert not breaker.allow()
+
+
+# --- CaptionService ---
+def test_pending_cap_fails_fast_or_waits():
+    captioner = BlockingCaptioner()
+    service = CaptionService(captioner, max_workers=1, max_pending=2, timeout=5)
+    try:
+        futures = [service.submit("img", "p"), service.submit("img", "p")]
+        with pytest.raises(CaptionUnavailableError, match="in flight"):
+            service.submit("img", "p")
+        with pytest.raises(CaptionUnavailableError):
+            service.submit("img", "p", wait=0.05)
+
+        waiting = {}
+        thread = threading.Thread(target=lambda: waiting.update(f=service.submit("img", "p", wait=5)))
+        thread.start()
+        captioner.release.set()
+        thread.join(5)
+        assert [service.result(f) for f in futures + [waiting["f"]]] == ["done"] * 3
+    finally:
+        captioner.release.set()
+        service.shutdown()
+
+
+def test_failures_trip_the_breaker():
+    service = CaptionService(FailingCaptioner(), max_workers=1, breaker=CircuitBreaker(failure_threshold=2))
+    try:
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                service.caption("img", "p")
+        with pytest.raises(CaptionUnavailableError, match="circuit open"):
+            service.submit("img", "p")
+    finally:
+        service.shutdown()
+
+
+def test_result_times_out_but_keeps_the_slot():
+    captioner = BlockingCaptioner()
+    service = CaptionService(captioner, max_workers=1, max_pending=1, timeout=0.05)
+    try:
+        future = service.submit("img", "p")
+        with pytest.raises(TimeoutError):
+            service.result(future)
+        # The call is still running, so its slot is still taken.
+        with pytest.raises(CaptionUnavailableError):
+            service.submit("img", "p")
+        captioner.release.set()
+        future.result(5)
+        assert service.caption("img", "p") == "done"
+    finally:
+        captioner.release.set()
+        service.shutdown()
+
+
+def test_no_captioner_is_unavailable():
+    with pytest.raises(CaptionUnavailableError):
+        CaptionService(None).submit("img", "p")
+
+
+def test_stub_captioner():
+    assert StubCaptioner(text="hi").caption("img", "p") == "hi"
+
+
+# --- GeminiCaptioner ---
+def test_gemini_client_gets_the_timeout_in_ms(monkeypatch):
+    genai = pytest.importorskip("google.genai")
+    created = {}
+    monkeypatch.setattr(genai, "Client", lambda **kwargs: created.update(kwargs) or object())
+
+    GeminiCaptioner(api_key="test-key", timeout=2.5).client
+    assert created["api_key"] == "test-key"
+    assert created["http_options"].timeout == 2500
+
+
+# --- gemini_image ---
+def encoded(image, fmt, **params):
+    out = BytesIO()
+    image.save(out, fmt, **params)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fmt, mime_type", [("JPEG", "image/jpeg"), ("PNG", "image/png"), ("WEBP", "image/webp")])
+def test_supported_formats_pass_through(fmt, mime_type):
+    data = encoded(Image.new("RGB", (8, 8), "red"), fmt)
+    assert gemini_image(Image.open(BytesIO(data)), data) == ImageBytes(data, mime_type)
+
+
+def test_mpo_is_sent_as_jpeg():
+    frame = Image.new("RGB", (8, 8), "red")
+    data = encoded(frame, "MPO", save_all=True, append_images=[frame])
+    image = Image.open(BytesIO(data))
+    assert image.format == "MPO"
+    assert gemini_image(image, data) == ImageBytes(data, "image/jpeg")
+
+
+@pytest.mark.parametrize("fmt, mode", [("BMP", "RGB"), ("GIF", "P"), ("TIFF", "CMYK")])
+def test_other_formats_are_reencoded_to_png(fmt, mode):
+    data = encoded(Image.new(mode, (8, 8)), fmt)
+    blob = gemini_image(Image.open(BytesIO(data)), data)
+    assert blob.mime_type == "image/png"
+    png = Image.open(BytesIO(blob.data))
+    assert png.format == "PNG"
+    assert png.size == (8, 8)
@@ -0,0 +1,192 @@
+"""HistoryWriter and the history read side, against mongomock."""
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from history import HistoryWriter, decode_cursor, encode_cursor, history_page
+
+
+@pytest.fixture
+def collection():
+    collection = mongomock.MongoClient().db.analysis_history
+    # Same index the analysis cache creates on this collection.
+    collection.create_index("file_digest", unique=True, sparse=True)
+    return collection
+
+
+@pytest.fixture
+def writer(collection):
+    # Large batch and interval: records stay buffered until flush() or close().
+    writer = HistoryWriter(collection, max_batch=1000, flush_interval=60, max_buffer=10)
+    yield writer
+    writer.close(timeout=1)
+
+
+def fail_inserts(monkeypatch, collection):
+    def insert_many(*args, **kwargs):
+        raise AutoReconnect("mongo is down")
+    monkeypatch.setattr(collection, "insert_many", insert_many)
+
+
+# --- HistoryWriter ---
+def test_add_buffers_until_flush(writer, collection):
+    ids = writer.add_many([{"n": 1}, {"n": 2}])
+    assert writer.pending() == 2
+    assert collection.count_documents({}) == 0
+    assert writer.find(ids[0])["n"] == 1
+
+    assert writer.flush() == 2
+    assert writer.pending() == 0
+    assert writer.find(ids[0]) is None
+    assert sorted(d["_id"] for d in collection.find()) == sorted(ids)
+
+
+def test_duplicate_digest_is_stored_without_it(writer, collection):
+    first = writer.add({"file_digest": "abc", "n": 1})
+    second = writer.add({"file_digest": "abc", "n": 2})
+    writer.flush()
+
+    assert collection.count_documents({}) == 2
+    assert collection.find_one({"_id": first})["file_digest"] == "abc"
+    assert "file_digest" not in collection.find_one({"_id": second})
+    assert writer.failed == 0
+
+
+def test_failed_flush_requeues_then_retries(writer, collection, monkeypatch):
+    record_id = writer.add({"n": 1})
+    fail_inserts(monkeypatch, collection)
+
+    assert writer.flush() == 0
+    assert writer.pending() == 1
+    assert writer.stats()["last_error"] == "mongo is down"
+    writer.add({"n": 2})
+
+    monkeypatch.undo()
+    assert writer.flush() == 2
+    assert writer.stats()["last_error"] is None
+    # Requeued records keep their place ahead of newer ones.
+    assert [d["n"] for d in collection.find().sort("_id", 1)] == [1, 2]
+    assert collection.find_one({"_id": record_id}) is not None
+
+
+def test_requeue_is_bounded_by_max_buffer(writer, collection, monkeypatch):
+    writer.add_many([{"n": n} for n in range(8)])
+    fail_inserts(monkeypatch, collection)
+    writer.flush()
+    # Buffer refills while Mongo is down; requeue only what still fits.
+    writer.flush()
+    assert writer.pending() == 8
+
+    writer.max_buffer = 5
+    writer.flush()
+    assert writer.pending() == 5
+    assert writer.failed == 3
+
+
+def test_update_patches_buffered_record(writer, collection, monkeypatch):
+    record_id = writer.add({"caption_status": "pending"})
+
+    def update_one(*args, **kwargs):
+        raise AssertionError("buffered record went to Mongo")
+    monkeypatch.setattr(collection, "update_one", update_one)
+    writer.update(record_id, {"caption_status": "done", "gemini_caption": "ok"})
+    monkeypatch.undo()
+
+    writer.flush()
+    stored = collection.find_one({"_id": record_id})
+    assert stored["caption_status"] == "done"
+    assert stored["gemini_caption"] == "ok"
+
+
+def test_update_after_flush_goes_to_mongo(writer, collection):
+    writer.add({"file_digest": "abc"})
+    record_id = writer.add({"caption_status": "pending"})
+    writer.flush()
+
+    # The digest is taken: the rest of the update must still land.
+    writer.update(record_id, {"caption_status": "done", "file_digest": "abc"})
+    stored = collection.find_one({"_id": record_id})
+    assert stored["caption_status"] == "done"
+    assert "file_digest" not in stored
+
+
+def test_close_drains_buffer(collection):
+    writer = HistoryWriter(collection, max_batch=1000, flush_interval=60)
+    writer.add_many([{"n": n} for n in range(5)])
+    assert collection.count_documents({}) == 0
+
+    writer.close(timeout=5)
+    assert collection.count_documents({}) == 5
+    assert writer.pending() == 0
+    assert not writer._thread.is_alive()
+
+
+def test_full_buffer_flushes_on_the_caller(collection):
+    writer = HistoryWriter(collection, max_batch=1000, flush_interval=60, max_buffer=3)
+    try:
+        writer.add_many([{"n": n} for n in range(3)])
+        assert collection.count_documents({}) == 3
+    finally:
+        writer.close(timeout=1)
+
+
+# --- history_page ---
+@pytest.fixture
+def timeline(collection):
+    """Seven records, newest first; the middle three share one timestamp."""
+    start = datetime(2024, 5, 1, 12, 0, 0)
+    times = [start - timedelta(minutes=m) for m in (0, 1, 2, 2, 2, 3, 4)]
+    docs = [
+        {"_id": ObjectId(), "analysis_time": t, "keras_class": "a" if i % 2 else "b", "user_session": "s"}
+        for i, t in enumerate(times)
+    ]
+    collection.insert_many(docs)
+    return sorted(docs, key=lambda d: (d["analysis_time"], d["_id"]), reverse=True)
+
+
+def walk(collection, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        docs, cursor = history_page(collection, limit=limit, cursor=cursor, **filters)
+        pages.append([d["_id"] for d in docs])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 6])
+def test_pages_cover_every_record_once(collection, timeline, limit):
+    pages = walk(collection, limit)
+    assert [i for page in pages for i in page] == [d["_id"] for d in timeline]
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_exact_multiple_has_no_empty_last_page(collection, timeline):
+    docs, cursor = history_page(collection, limit=len(timeline))
+    assert len(docs) == len(timeline)
+    assert cursor is None
+
+    pages = walk(collection, 7)
+    assert len(pages) == 1
+
+
+def test_cursor_inside_a_timestamp_tie(collection, timeline):
+    # Page boundary after the first of the three records sharing a timestamp.
+    _, cursor = history_page(collection, limit=3)
+    assert cursor == encode_cursor(timeline[2])
+    docs, cursor = history_page(collection, limit=1, cursor=cursor)
+    assert docs[0]["_id"] == timeline[3]["_id"]
+    assert docs[0]["analysis_time"] == timeline[2]["analysis_time"]
+    assert decode_cursor(cursor) == (timeline[3]["analysis_time"], timeline[3]["_id"])
+
+
+def test_filters_apply_across_pages(collection, timeline):
+    pages = walk(collection, 2, keras_class="a")
+    assert [i for page in pages for i in page] == [d["_id"] for d in timeline if d["keras_class"] == "a"]
+
+
+def test_invalid_cursor(collection):
+    with pytest.raises(ValueError):
+        history_page(collection, cursor="not-a-cursor")
@@ -0,0 +1,42 @@
+"""open_image drafting and the (224, 224, 3) tensors preprocess produces."""
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from preprocessing import IMAGE_SIZE, open_image, preprocess
+
+
+def encoded(fmt, size=(1600, 1200), **params):
+    image = Image.new("RGB", size, "red")
+    out = BytesIO()
+    image.save(out, fmt, **params)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fmt, params", [
+    ("JPEG", {}),
+    ("MPO", {"save_all": True, "append_images": [Image.new("RGB", (1600, 1200))]}),
+])
+def test_jpeg_and_mpo_are_drafted(fmt, params):
+    image = open_image(encoded(fmt, **params))
+    assert image.format == fmt
+    # Largest DCT scale that still covers 224x224: 1/4 of 1600x1200.
+    assert image.size == (400, 300)
+
+
+def test_draft_can_be_turned_off():
+    assert open_image(encoded("JPEG"), draft=False).size == (1600, 1200)
+
+
+def test_other_formats_are_not_drafted():
+    assert open_image(encoded("PNG", size=(640, 480))).size == (640, 480)
+
+
+def test_preprocess_scales_to_minus_one_one():
+    out = preprocess(encoded("PNG", size=(300, 200)))
+    assert out.shape == (*IMAGE_SIZE, 3)
+    assert out.dtype == np.float32
+    # Pure red: R at +1, G and B at -1.
+    assert np.allclose(out[..., 0], 1.0) and np.allclose(out[..., 1:], -1.0)
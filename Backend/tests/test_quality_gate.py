@@ -0,0 +1,157 @@
+"""The quality gate: score splitting, the threshold, metrics and the TFLite fallback."""
+import os
+import sys
+import types
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from batcher import BatchingPredictor
+from inference_backends import load_backend
+from model_loader import ModelLoader
+from result_cache import file_digest
+
+CLASS_NAMES = [f"{i} {name}\n" for i, name in enumerate(
+    ["Agreeableness", "Conscientiousness", "Extraversion", "Neuroticism", "Openness"])]
+PERSONALITY = [0.1, 0.1, 0.6, 0.1, 0.1]
+
+
+class FusedModel:
+    """Returns the same [personality | non-defective, defective] row for every image."""
+
+    def __init__(self, defect_score, fused=True):
+        self.fused = fused
+        self.batch_sizes = (1,)
+        self.row = PERSONALITY + [1 - defect_score, defect_score]
+
+    def predict(self, batch):
+        return np.tile(np.asarray(self.row, dtype=np.float32), (len(batch), 1))
+
+
+@pytest.fixture
+def gate(app_module, monkeypatch):
+    """Turns the gate on and returns a function that loads a fake backend."""
+    monkeypatch.setattr(app_module, "QUALITY_GATE", True)
+    monkeypatch.setattr(app_module, "QUALITY_GATE_THRESHOLD", 0.5)
+    monkeypatch.setattr(app_module, "DEFECTIVE_INDEX", 1)
+    predictors = []
+
+    def load(model):
+        predictor = BatchingPredictor(model.predict, max_batch_size=1)
+        predictors.append(predictor)
+        loader = ModelLoader(lambda: (model, CLASS_NAMES, predictor), lambda loaded: loaded[2].start())
+        monkeypatch.setattr(app_module, "model_loader", loader.start(background=False))
+        return model
+
+    yield load
+    for predictor in predictors:
+        predictor.stop(timeout=5)
+
+
+def upload(app_module, color):
+    out = BytesIO()
+    Image.new("RGB", (32, 32), color).save(out, "JPEG")
+    data = out.getvalue()
+    response = app_module.app.test_client().post(
+        "/upload_and_analyze", data={"image": (BytesIO(data), "page.jpg")})
+    return response, file_digest(data)
+
+
+def test_defective_index_comes_from_the_labels(app_module, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(app_module.__file__))
+    assert app_module.read_detection_labels() == 1
+
+
+def test_split_scores_picks_the_defective_column(app_module, gate, monkeypatch):
+    gate(FusedModel(0.3))
+    row = np.asarray(PERSONALITY + [0.7, 0.3])
+    scores, defect_score = app_module.split_scores(row, CLASS_NAMES)
+    assert scores.tolist() == PERSONALITY
+    assert defect_score == pytest.approx(0.3)
+
+    monkeypatch.setattr(app_module, "DEFECTIVE_INDEX", 0)
+    assert app_module.split_scores(row, CLASS_NAMES)[1] == pytest.approx(0.7)
+
+
+def test_gate_is_inactive_without_a_fused_backend(app_module, gate, monkeypatch):
+    gate(FusedModel(0.9, fused=False))
+    assert not app_module.quality_gate_active()
+    row = np.asarray(PERSONALITY)
+    assert app_module.split_scores(row, CLASS_NAMES) == (row, None)
+
+    gate(FusedModel(0.9))
+    assert app_module.quality_gate_active()
+    monkeypatch.setattr(app_module, "QUALITY_GATE", False)
+    assert not app_module.quality_gate_active()
+
+
+@pytest.mark.parametrize("defect_score, color, status", [
+    (0.49, "red", 200),
+    (0.5, "green", 422),
+    (0.9, "blue", 422),
+])
+def test_threshold_rejects_at_or_above(app_module, gate, defect_score, color, status):
+    gate(FusedModel(defect_score))
+    outcome = "rejected" if status == 422 else "passed"
+    checked = app_module.QUALITY_GATE_TOTAL.value(handler="analyze", outcome=outcome)
+    errors = app_module.REQUEST_ERRORS.value(handler="analyze", status=422)
+
+    response, digest = upload(app_module, color)
+    assert response.status_code == status
+    assert app_module.QUALITY_GATE_TOTAL.value(handler="analyze", outcome=outcome) == checked + 1
+    # A rejection is an answer, not an error.
+    assert app_module.REQUEST_ERRORS.value(handler="analyze", status=422) == errors
+    if status == 422:
+        assert response.json["rejected"] is True
+        assert response.json["defect_score"] == pytest.approx(defect_score)
+        assert app_module.upload_store.original_for(digest) is None
+    else:
+        assert response.json["class"] == "2 Extraversion"
+
+
+# --- TFLite fallback ---
+@pytest.fixture
+def interpreters(monkeypatch):
+    """A fake tflite_runtime; returns the model paths interpreters were built for."""
+    paths = []
+
+    class Interpreter:
+        def __init__(self, model_path, num_threads=None):
+            paths.append(os.path.basename(model_path))
+
+        def get_input_details(self):
+            return [{"index": 0, "shape": np.array([1, 224, 224, 3])}]
+
+        def get_output_details(self):
+            return [{"index": 1}]
+
+        def resize_tensor_input(self, index, shape):
+            pass
+
+        def allocate_tensors(self):
+            pass
+
+    package = types.ModuleType("tflite_runtime")
+    package.interpreter = types.ModuleType("tflite_runtime.interpreter")
+    package.interpreter.Interpreter = Interpreter
+    monkeypatch.setitem(sys.modules, "tflite_runtime", package)
+    monkeypatch.setitem(sys.modules, "tflite_runtime.interpreter", package.interpreter)
+    return paths
+
+
+def test_tflite_without_fused_export_serves_the_plain_model(tmp_path, interpreters):
+    model_path = str(tmp_path / "personality_model.h5")
+    with pytest.raises(FileNotFoundError):
+        load_backend("tflite-float", model_path, detector_path="detector.h5")
+
+    (tmp_path / "personality_model.float.tflite").write_bytes(b"")
+    backend = load_backend("tflite-float", model_path, detector_path="detector.h5")
+    assert backend.fused is False
+    assert interpreters == ["personality_model.float.tflite"]
+
+    (tmp_path / "fused_model.float.tflite").write_bytes(b"")
+    backend = load_backend("tflite-float", model_path, detector_path="detector.h5")
+    assert backend.fused is True
+    assert interpreters[-1] == "fused_model.float.tflite"
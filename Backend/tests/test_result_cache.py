@@ -0,0 +1,102 @@
+"""LRUCache limits and the two-tier ResultCache."""
+import json
+
+import mongomock
+import pytest
+
+import result_cache
+from result_cache import LRUCache, ResultCache, file_digest
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def size_of(value):
+    return len(json.dumps(value))
+
+
+# --- LRUCache ---
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_byte_limit_evicts_and_tracks_size():
+    value = {"text": "x" * 20}
+    cache = LRUCache(max_entries=100, max_bytes=2 * size_of(value))
+    for key in "abc":
+        cache.put(key, value)
+    assert cache.get("a") is None
+    assert len(cache) == 2
+    assert cache.size_bytes == 2 * size_of(value)
+
+    # Replacing a key does not count its old size twice.
+    cache.put("c", value)
+    assert cache.size_bytes == 2 * size_of(value)
+
+
+def test_oversized_value_is_not_cached():
+    cache = LRUCache(max_bytes=10)
+    cache.put("big", "x" * 100)
+    assert cache.get("big") is None
+    assert cache.size_bytes == 0
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache(ttl_seconds=60)
+    cache.put("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+
+# --- ResultCache ---
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.ocr_results
+
+
+def test_persistent_tier_refills_memory(collection):
+    cache = ResultCache("ocr", collection, ["recognized_text"])
+    cache.ensure_index()
+    digest = file_digest(b"image bytes")
+
+    assert cache.get(digest) is None
+    cache.put(digest, {"recognized_text": "hello"}, persist=True)
+
+    restarted = ResultCache("ocr", collection, ["recognized_text"])
+    assert restarted.get(digest) == {"recognized_text": "hello"}
+    assert restarted.get(digest) == {"recognized_text": "hello"}
+    stats = restarted.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+    assert cache.stats()["misses"] == 1
+
+
+def test_first_persisted_value_wins(collection):
+    cache = ResultCache("ocr", collection, ["recognized_text"])
+    cache.ensure_index()
+    cache.put("d", {"recognized_text": "first"}, persist=True)
+    cache.put("d", {"recognized_text": "second"}, persist=True)
+    assert collection.count_documents({"file_digest": "d"}) == 1
+    assert collection.find_one({"file_digest": "d"})["recognized_text"] == "first"
+
+
+def test_unpersisted_put_stays_in_memory(collection):
+    cache = ResultCache("analysis", collection, ["keras_class"])
+    cache.put("d", {"keras_class": "x"})
+    assert cache.get("d") == {"keras_class": "x"}
+    assert collection.count_documents({}) == 0
@@ -0,0 +1,215 @@
+"""UploadStore: dedup, background writes, previews, the sweeper and /uploads."""
+import os
+import threading
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import upload_store
+from result_cache import file_digest
+from upload_store import UploadStore, thumbnail_name
+
+DAY = 86400
+
+
+def image_bytes(color, size=(64, 48), fmt="JPEG"):
+    out = BytesIO()
+    Image.new("RGB", size, color).save(out, fmt)
+    return out.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = UploadStore(str(tmp_path), write_threads=1, thumbnail_size=16)
+    yield store
+    store.close()
+
+
+def blocked(store):
+    """Holds the store's only write thread until the returned event is set."""
+    gate = threading.Event()
+    store._pool.submit(gate.wait, 5)
+    return gate
+
+
+def save(store, data, ext=".jpg"):
+    return store.save(file_digest(data), data, ext)
+
+
+def age(store, name, days):
+    """Backdates an upload and its preview by ``days``."""
+    mtime = time.time() - days * DAY
+    for n in (name, thumbnail_name(name)):
+        if os.path.exists(store.path(n)):
+            os.utime(store.path(n), (mtime, mtime))
+
+
+def files_under(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, names in os.walk(root) for f in names)
+
+
+# --- Writes ---
+def test_save_deduplicates(store):
+    data = image_bytes("red")
+    assert save(store, data) == save(store, data) == file_digest(data) + ".jpg"
+    store.close()
+    assert (store.written, store.deduplicated) == (1, 1)
+
+
+def test_pending_serves_bytes_until_the_write_lands(store):
+    data = image_bytes("red")
+    gate = blocked(store)
+    name = save(store, data)
+    assert store.pending(name) == data
+    assert store.original_for(file_digest(data)) == name
+    assert not os.path.exists(store.path(name))
+
+    gate.set()
+    store.close()
+    assert store.pending(name) is None
+    assert store.stats()["pending_bytes"] == 0
+
+
+def test_sharded_atomic_write_and_preview(store, tmp_path):
+    data = image_bytes("red", size=(600, 400))
+    digest = file_digest(data)
+    name = save(store, data)
+    store.close()
+
+    assert store.path(name) == os.path.join(str(tmp_path), digest[:2], digest[2:4], name)
+    with open(store.path(name), "rb") as f:
+        assert f.read() == data
+    preview = Image.open(store.path(thumbnail_name(name)))
+    assert max(preview.size) == 16
+    assert not any(os.path.basename(f).startswith(".tmp-") for f in files_under(str(tmp_path)))
+
+
+def test_failed_write_leaves_no_temp_file(store, tmp_path, monkeypatch):
+    def replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(upload_store.os, "replace", replace)
+    with pytest.raises(OSError):
+        store._atomic_write(store.path("ab" * 32 + ".jpg"), b"data")
+    assert files_under(str(tmp_path)) == []
+
+
+# --- Sweeper ---
+def test_sweep_by_age_takes_the_preview_along(store):
+    old, new = save(store, image_bytes("red")), save(store, image_bytes("blue"))
+    store.close()
+    age(store, old, 10)
+
+    files, removed = store.sweep(max_age_seconds=7 * DAY)
+    assert files == 2
+    assert removed == store.stats()["swept_bytes"] > 0
+    assert not os.path.exists(store.path(old))
+    assert not os.path.exists(store.path(thumbnail_name(old)))
+    assert os.path.exists(store.path(new))
+
+
+def test_sweep_by_size_removes_oldest_first(store):
+    names = [save(store, image_bytes(color)) for color in ("red", "green", "blue")]
+    store.close()
+    for days, name in zip((3, 2, 1), names):
+        age(store, name, days)
+    newest = sum(os.path.getsize(store.path(n)) for n in (names[2], thumbnail_name(names[2])))
+
+    files, _ = store.sweep(max_bytes=newest)
+    assert files == 4
+    assert [os.path.exists(store.path(n)) for n in names] == [False, False, True]
+
+
+def test_sweep_skips_in_flight_digests(store):
+    data = image_bytes("red")
+    name = save(store, data)
+    store.close()
+    age(store, name, 10)
+
+    store = UploadStore(store.root, write_threads=1, thumbnail_size=16)
+    gate = blocked(store)
+    save(store, data)
+    assert store.sweep(max_age_seconds=DAY) == (0, 0)
+    assert os.path.exists(store.path(name))
+    gate.set()
+    store.close()
+
+
+def test_resave_refreshes_an_aged_file(store):
+    data = image_bytes("red")
+    name = save(store, data)
+    store.close()
+    age(store, name, 10)
+
+    store = UploadStore(store.root, write_threads=1, thumbnail_size=16)
+    save(store, data)
+    store.close()
+    assert store.deduplicated == 1
+    assert time.time() - os.path.getmtime(store.path(name)) < DAY
+    assert store.sweep(max_age_seconds=DAY) == (0, 0)
+
+
+def test_sweep_only_deletes_files_it_owns(store, tmp_path):
+    name = save(store, image_bytes("red"))
+    store.close()
+    digest = name.split(".")[0]
+    shard = os.path.dirname(store.path(name))
+    root = str(tmp_path)
+
+    legacy = "3f2b8c1e-9a4d-4b6e-8f1a-2c3d4e5f6a7b_scan.png"
+    temp = os.path.join(shard, ".tmp-" + "0" * 32)
+    foreign = [".gitkeep", "README.txt", os.path.join("notes", "a.jpg"),
+               os.path.join("ff", "ff", name), os.path.join(digest[:2], digest[2:4], "notes.txt")]
+    for path in [legacy, temp] + foreign:
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), "wb") as f:
+            f.write(b"x" * 10)
+    os.utime(temp, (0, 0))
+
+    store.sweep(max_bytes=1)
+    assert files_under(root) == sorted(foreign)
+
+
+# --- /uploads ---
+@pytest.fixture
+def client(app_module, store, monkeypatch):
+    monkeypatch.setattr(app_module, "upload_store", store)
+    return app_module.app.test_client()
+
+
+def test_uploads_serves_pending_bytes(client, store):
+    data = image_bytes("red")
+    gate = blocked(store)
+    name = save(store, data)
+    response = client.get(f"/uploads/{name}")
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.mimetype == "image/jpeg"
+
+    # No preview yet: the original stands in, without long-term caching.
+    response = client.get(f"/uploads/{thumbnail_name(name)}")
+    assert response.data == data
+    assert response.cache_control.max_age == 0
+    gate.set()
+
+
+def test_uploads_conditional_and_range(client, store):
+    data = image_bytes("red")
+    name = save(store, data)
+    store.close()
+
+    response = client.get(f"/uploads/{name}")
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+    etag, modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+    assert client.get(f"/uploads/{name}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/uploads/{name}", headers={"If-Modified-Since": modified}).status_code == 304
+
+    response = client.get(f"/uploads/{name}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.data == data[:10]
+    assert response.headers["Content-Range"] == f"bytes 0-9/{len(data)}"
+
+    assert client.get("/uploads/" + "0" * 64 + ".jpg").status_code == 404
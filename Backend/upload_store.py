@@ -0,0 +1,303 @@
+"""Content-addressed storage for uploaded images.
+
+Every upload is stored under the sha256 of its bytes, sharded two levels deep
+so no directory grows past a few hundred entries::
+
+    UPLOAD_FOLDER/ab/cd/abcd...ef.jpg          original
+    UPLOAD_FOLDER/ab/cd/abcd...ef.thumb.webp   preview (THUMBNAIL_SIZE px)
+
+The public name is just the file name (``abcd...ef.jpg``), so image URLs keep
+the ``FILE_SERVER_BASE_URL + name`` shape. Identical bytes map to the same
+name and are stored once.
+
+``save`` returns immediately: the bytes are kept in memory until a background
+thread has written them (to a temporary file, then ``os.replace``) and built
+the preview. Files from before this layout (``uuid_filename`` in the root)
+are still served. ``sweep`` enforces the age and size limits; it only ever
+deletes files with one of those names, so other files in the folder are safe.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, features
+
+CONTENT_NAME = re.compile(r"^([0-9a-f]{64})(\.thumb\.(?:webp|jpg)|\.[a-z0-9]{1,5})$")
+LEGACY_NAME = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}_.+$")
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "BMP": ".bmp", "TIFF": ".tif", "WEBP": ".webp"}
+THUMBNAIL_FORMAT = ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+TEMP_PREFIX = ".tmp-"
+TEMP_NAME = re.compile(r"^\.tmp-[0-9a-f]{32}$")
+SHARD_PART = re.compile(r"^[0-9a-f]{2}$")
+TEMP_MAX_AGE_SECONDS = 3600
+
+
+def extension_for(image_format, filename=""):
+    """File extension for an upload, from the decoded format if known."""
+    if image_format in EXTENSIONS:
+        return EXTENSIONS[image_format]
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,5}", ext) else ".bin"
+
+
+def thumbnail_name(name):
+    """Preview name for a content-addressed upload, else None."""
+    match = CONTENT_NAME.match(name)
+    if match is None or ".thumb." in name:
+        return None
+    return match.group(1) + ".thumb" + THUMBNAIL_FORMAT[1]
+
+
+class UploadStore:
+    """Sharded, deduplicating upload directory with background writes."""
+
+    def __init__(self, root, write_threads=2, thumbnail_size=256, max_pending_bytes=64 * 1024 * 1024,
+                 observe=None):
+        self.root = root
+        self.observe = observe  # optional observe(task, seconds) for write latency
+        self.thumbnail_size = thumbnail_size
+        self.max_pending_bytes = max_pending_bytes
+        self.written = 0
+        self.deduplicated = 0
+        self.swept_files = 0
+        self.swept_bytes = 0
+        self._pool = ThreadPoolExecutor(max_workers=write_threads, thread_name_prefix="upload-write")
+        self._pending = {}
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        """Filesystem path for a public name; legacy names live in the root."""
+        match = CONTENT_NAME.match(name)
+        if match is None:
+            return os.path.join(self.root, name)
+        digest = match.group(1)
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def save(self, digest, data, ext):
+        """Stores ``data`` under its digest and returns the public name.
+
+        The write happens in the background; until it lands, ``pending``
+        serves the bytes from memory.
+        """
+        name = digest + ext
+        with self._lock:
+            if name in self._pending:
+                self.deduplicated += 1
+                return name
+            inline = self._pending_bytes + len(data) > self.max_pending_bytes
+            if not inline:
+                self._pending[name] = data
+                self._pending_bytes += len(data)
+        if inline:
+            # Disk is not keeping up; write on the request thread instead of
+            # holding more uploads in memory.
+            self._write(name, data)
+        else:
+            self._pool.submit(self._write_pending, name, data)
+        return name
+
+    def original_for(self, digest):
+        """Public name of the stored original for ``digest``, or None."""
+        with self._lock:
+            for name in self._pending:
+                if name.startswith(digest) and ".thumb." not in name:
+                    return name
+        directory = os.path.dirname(self.path(digest + ".bin"))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return None
+        return next((n for n in names if n.startswith(digest) and ".thumb." not in n), None)
+
+    def pending(self, name):
+        """Bytes of an upload that has not reached disk yet, else None."""
+        with self._lock:
+            return self._pending.get(name)
+
+    def _write_pending(self, name, data):
+        try:
+            self._write(name, data)
+        except Exception as e:
+            print(f"Failed to store upload {name}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+                self._pending_bytes -= len(data)
+
+    def _write(self, name, data):
+        path = self.path(name)
+        started = time.perf_counter()
+        if os.path.exists(path):
+            # Same bytes already stored; refresh the mtime the sweeper ages on.
+            os.utime(path)
+            self.deduplicated += 1
+        else:
+            self._atomic_write(path, data)
+            self.written += 1
+            self._observe("upload_write", started)
+        thumb = thumbnail_name(name)
+        if thumb is not None and not os.path.exists(self.path(thumb)):
+            started = time.perf_counter()
+            try:
+                self._atomic_write(self.path(thumb), self._thumbnail(data))
+                self._observe("thumbnail", started)
+            except Exception as e:
+                print(f"Could not build preview for {name}: {e}")
+
+    def _observe(self, task, started):
+        if self.observe is not None:
+            self.observe(task, time.perf_counter() - started)
+
+    def _atomic_write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        temp = os.path.join(directory, f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+        try:
+            with open(temp, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+
+    def _thumbnail(self, data):
+        image = Image.open(BytesIO(data))
+        size = (self.thumbnail_size, self.thumbnail_size)
+        if image.format in ("JPEG", "MPO"):
+            image.draft("RGB", size)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        fmt = THUMBNAIL_FORMAT[0]
+        if fmt == "JPEG" and image.mode == "RGBA":
+            image = image.convert("RGB")
+        out = BytesIO()
+        image.save(out, fmt, quality=80)
+        return out.getvalue()
+
+    def close(self):
+        """Waits for queued writes."""
+        self._pool.shutdown(wait=True)
+
+    # --- Retention ---
+    def sweep(self, max_age_seconds=None, max_bytes=None):
+        """Deletes uploads older than ``max_age_seconds``, then the oldest
+        until the store is under ``max_bytes``. An original and its preview
+        are aged and deleted together. Only files this store could have
+        written are considered (see _sweep_key). Returns (files, bytes) removed."""
+        now = time.time()
+        groups = {}  # digest or legacy name -> [newest mtime, total size, paths]
+        for path, stat in self._scan():
+            key = self._sweep_key(path)
+            if key is None:
+                continue
+            if key is TEMP_PREFIX:
+                # Left behind by a crash mid-write.
+                if now - stat.st_mtime > TEMP_MAX_AGE_SECONDS:
+                    self._remove([path])
+                continue
+            group = groups.setdefault(key, [0.0, 0, []])
+            group[0] = max(group[0], stat.st_mtime)
+            group[1] += stat.st_size
+            group[2].append(path)
+
+        with self._lock:
+            in_flight = {CONTENT_NAME.match(n).group(1) for n in self._pending if CONTENT_NAME.match(n)}
+        ordered = sorted((g for k, g in groups.items() if k not in in_flight), key=lambda g: g[0])
+        total = sum(g[1] for g in groups.values())
+        files = removed = 0
+        for mtime, size, paths in ordered:
+            expired = max_age_seconds and now - mtime > max_age_seconds
+            over = max_bytes and total > max_bytes
+            if not expired and not over:
+                break
+            files += self._remove(paths)
+            removed += size
+            total -= size
+        self.swept_files += files
+        self.swept_bytes += removed
+        return files, removed
+
+    def _sweep_key(self, path):
+        """What the sweeper may do with ``path``: its group key (digest or
+        legacy name), TEMP_PREFIX for a temporary file of ours, or None to
+        leave it alone. Only content names in their shard directory, legacy
+        ``<uuid4>_<name>`` files in the root and our own temporary files
+        qualify."""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        name = parts[-1]
+        in_shard = len(parts) == 3 and all(SHARD_PART.match(p) for p in parts[:2])
+        match = CONTENT_NAME.match(name)
+        if match is not None:
+            digest = match.group(1)
+            return digest if in_shard and parts[:2] == [digest[:2], digest[2:4]] else None
+        if LEGACY_NAME.match(name):
+            return name if len(parts) == 1 else None
+        if TEMP_NAME.match(name) and in_shard:
+            return TEMP_PREFIX
+        return None
+
+    def _scan(self):
+        stack = [self.root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue  # removed by another worker's sweep
+
+    def _remove(self, paths):
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def start_sweeper(self, interval_seconds, max_age_seconds=None, max_bytes=None):
+        """Runs ``sweep`` every ``interval_seconds`` on a daemon thread."""
+        if not max_age_seconds and not max_bytes:
+            return None
+
+        def run():
+            while True:
+                try:
+                    files, removed = self.sweep(max_age_seconds, max_bytes)
+                    if files:
+                        print(f"Upload sweep removed {files} files ({removed / 1e6:.1f} MB)")
+                except Exception as e:
+                    print(f"Upload sweep failed: {e}")
+                time.sleep(interval_seconds)
+
+        thread = threading.Thread(target=run, name="upload-sweeper", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            pending, pending_bytes = len(self._pending), self._pending_bytes
+        return {
+            "pending": pending,
+            "pending_bytes": pending_bytes,
+            "written": self.written,
+            "deduplicated": self.deduplicated,
+            "swept_files": self.swept_files,
+            "swept_bytes": self.swept_bytes,
+        }
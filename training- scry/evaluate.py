@@ -1,43 +1,264 @@
-from keras.models import load_model  # TensorFlow is required for Keras to work
-from PIL import Image, ImageOps  # Install pillow instead of PIL
+"""Streaming batch evaluation of the personality model.
+
+Scores a class-per-folder dataset (the layout train.py reads with
+flow_from_directory) and reports a confusion matrix, per-class
+precision/recall and throughput.
+
+Images are listed lazily, decoded and resized in a process pool, and fed to
+the model in fixed-size batches. Only a bounded window of batches is in
+flight at any time, so memory stays flat however large the dataset is.
+Progress is checkpointed so an interrupted run can be resumed.
+
+    python evaluate.py "D:/datasets/scry/test" --batch-size 64 --checkpoint eval.ckpt.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 import numpy as np
 
-# Disable scientific notation for clarity
-np.set_printoptions(suppress=True)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Share the backend's preprocessing so evaluation sees exactly what the API sees
+sys.path.insert(0, os.path.join(HERE, "..", "Backend"))
+from preprocessing import IMAGE_SIZE, fit, normalize_into, open_image
+
+DEFAULT_MODEL = os.path.join(HERE, "..", "Backend", "Keras model", "personality_model.h5")
+DEFAULT_LABELS = os.path.join(HERE, "..", "Backend", "Keras model", "labels.txt")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def read_labels(path):
+    """Reads Teachable-Machine style labels ("0 Agreeableness") into names."""
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return [line.split(" ", 1)[1] if line.split(" ", 1)[0].isdigit() else line for line in lines]
+
+
+def class_folders(root, labels):
+    """Maps each class folder under ``root`` to its label index."""
+    folders = sorted(e.name for e in os.scandir(root) if e.is_dir())
+    lookup = {name.lower(): i for i, name in enumerate(labels)}
+    mapping = []
+    for position, folder in enumerate(folders):
+        # Prefer a name match; otherwise fall back to flow_from_directory's
+        # alphabetical ordering, which is how train.py assigned indices.
+        index = lookup.get(folder.lower(), position)
+        if index >= len(labels):
+            raise SystemExit(f"Folder '{folder}' has no matching label in the labels file")
+        mapping.append((folder, index))
+    return mapping
+
+
+def iter_samples(root, mapping):
+    """Yields (path, label_index) in a stable order without listing everything up front."""
+    for folder, index in mapping:
+        with os.scandir(os.path.join(root, folder)) as entries:
+            names = sorted(e.name for e in entries if e.is_file())
+        for name in names:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, folder, name), index
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_images(paths, resample, draft):
+    """Worker: decodes and fits a chunk of images to uint8 (224, 224, 3) arrays.
+
+    uint8 keeps the pickled payload 4x smaller than float32; normalization
+    happens in the parent straight into the batch buffer.
+    """
+    out = []
+    for path in paths:
+        try:
+            out.append(np.asarray(fit(open_image(path, IMAGE_SIZE, draft), IMAGE_SIZE, resample)))
+        except Exception as e:
+            print(f"Skipping unreadable image {path}: {e}", file=sys.stderr)
+            out.append(None)
+    return out
+
+
+def load_checkpoint(path, root, labels):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        state = json.load(f)
+    if state.get("data_dir") != os.path.abspath(root) or state.get("labels") != labels:
+        raise SystemExit(f"Checkpoint {path} was written for a different dataset or label set")
+    return state
+
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def per_class_report(confusion, labels):
+    rows = []
+    for i, name in enumerate(labels):
+        tp = int(confusion[i, i])
+        predicted = int(confusion[:, i].sum())
+        actual = int(confusion[i, :].sum())
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / actual if actual else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        rows.append({"class": name, "precision": precision, "recall": recall,
+                     "f1": f1, "support": actual})
+    return rows
+
+
+def print_report(confusion, labels, images, seconds, skipped):
+    width = max(len(name) for name in labels) + 2
+    print("\nConfusion matrix (rows = true, columns = predicted):")
+    print(" " * width + "".join(f"{name[:8]:>10}" for name in labels))
+    for i, name in enumerate(labels):
+        print(f"{name:<{width}}" + "".join(f"{int(v):>10}" for v in confusion[i]))
+
+    print(f"\n{'class':<{width}}{'precision':>10}{'recall':>10}{'f1':>10}{'support':>10}")
+    for row in per_class_report(confusion, labels):
+        print(f"{row['class']:<{width}}{row['precision']:>10.3f}{row['recall']:>10.3f}"
+              f"{row['f1']:>10.3f}{row['support']:>10}")
+
+    total = int(confusion.sum())
+    accuracy = float(np.trace(confusion)) / total if total else 0.0
+    print(f"\nAccuracy: {accuracy:.4f} over {total} images ({skipped} skipped)")
+    if seconds > 0:
+        print(f"Throughput: {images / seconds:.1f} images/second ({images} images this run)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the personality model on a labelled image folder.")
+    parser.add_argument("data_dir", help="dataset root with one sub-folder per class")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--labels", default=DEFAULT_LABELS)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="batches decoded ahead of inference (default: 2 x workers)")
+    parser.add_argument("--resample", default="lanczos")
+    parser.add_argument("--no-draft", action="store_true", help="decode JPEGs at full resolution")
+    parser.add_argument("--checkpoint", help="resume from / periodically save progress to this file")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="batches between checkpoints")
+    parser.add_argument("--report", help="write the final metrics as JSON to this path")
+    args = parser.parse_args()
+
+    labels = read_labels(args.labels)
+    mapping = class_folders(args.data_dir, labels)
+    num_classes = len(labels)
+
+    state = load_checkpoint(args.checkpoint, args.data_dir, labels)
+    if state:
+        confusion = np.array(state["confusion"], dtype=np.int64)
+        done, skipped = state["processed"], state["skipped"]
+        print(f"Resuming from {args.checkpoint}: {done} images already scored")
+    else:
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        done, skipped = 0, 0
+
+    from keras.models import load_model  # imported here so pool workers stay light
+
+    model = load_model(args.model, compile=False)
+    batch = np.zeros((args.batch_size, *IMAGE_SIZE[::-1], 3), dtype=np.float32)
+    model.predict_on_batch(batch)  # build/trace once before timing
+
+    samples = islice(iter_samples(args.data_dir, mapping), done, None)
+    chunks = batched(samples, args.batch_size)
+    prefetch = args.prefetch or 2 * args.workers
+
+    def checkpoint():
+        if args.checkpoint:
+            save_checkpoint(args.checkpoint, {
+                "data_dir": os.path.abspath(args.data_dir),
+                "labels": labels,
+                "processed": done,
+                "skipped": skipped,
+                "confusion": confusion.tolist(),
+            })
 
-# Load the model
-model = load_model("D:\Sem 7 project\Scry\Backend\Keras model\personality_model.h5", compile=False)
+    images_this_run = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = deque()
 
-# Load the labels
-class_names = open("D:\Sem 7 project\Scry\Backend\Keras model\labels.txt", "r").readlines()
+        def refill():
+            while len(pending) < prefetch:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                paths = [path for path, _ in chunk]
+                targets = [label for _, label in chunk]
+                pending.append((pool.submit(load_images, paths, args.resample, not args.no_draft), targets))
 
-# Create the array of the right shape to feed into the keras model
-# The 'length' or number of images you can put into the array is
-# determined by the first position in the shape tuple, in this case 1
-data = np.ndarray(shape=(1, 224, 224, 3), dtype=np.float32)
+        refill()
+        batches = 0
+        try:
+            while pending:
+                future, targets = pending.popleft()
+                arrays = future.result()
+                refill()
 
-# Replace this with the path to your image
-image = Image.open("samples/WhatsApp Image 2025-11-01 at 19.03.28_1a4fcc74.jpg").convert("RGB")
+                n = 0
+                kept = []
+                for array, target in zip(arrays, targets):
+                    if array is None:
+                        skipped += 1
+                        continue
+                    normalize_into(array, batch[n])
+                    kept.append(target)
+                    n += 1
 
-# resizing the image to be at least 224x224 and then cropping from the center
-size = (224, 224)
-image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+                if n:
+                    # Always run the full fixed-size batch so the graph is
+                    # traced once; rows past n are stale and ignored.
+                    predictions = np.asarray(model.predict_on_batch(batch))[:n]
+                    np.add.at(confusion, (kept, predictions.argmax(axis=1)), 1)
 
-# turn the image into a numpy array
-image_array = np.asarray(image)
+                done += len(targets)
+                images_this_run += n
+                batches += 1
+                if batches % args.checkpoint_every == 0:
+                    checkpoint()
+                    rate = images_this_run / (time.perf_counter() - start)
+                    print(f"{done} images scored ({rate:.1f} images/s)", flush=True)
+        except KeyboardInterrupt:
+            for future, _ in pending:
+                future.cancel()
+            checkpoint()
+            print(f"\nInterrupted after {done} images; rerun with the same --checkpoint to resume.")
+            return 1
 
-# Normalize the image
-normalized_image_array = (image_array.astype(np.float32) / 127.5) - 1
+    seconds = time.perf_counter() - start
+    checkpoint()
+    print_report(confusion, labels, images_this_run, seconds, skipped)
 
-# Load the image into the array
-data[0] = normalized_image_array
+    if args.report:
+        total = int(confusion.sum())
+        with open(args.report, "w") as f:
+            json.dump({
+                "labels": labels,
+                "confusion": confusion.tolist(),
+                "per_class": per_class_report(confusion, labels),
+                "accuracy": float(np.trace(confusion)) / total if total else 0.0,
+                "images": total,
+                "skipped": skipped,
+                "images_per_second": images_this_run / seconds if seconds > 0 else 0.0,
+            }, f, indent=2)
+    return 0
 
-# Predicts the model
-prediction = model.predict(data)
-index = np.argmax(prediction)
-class_name = class_names[index]
-confidence_score = prediction[0][index]
 
-# Print prediction and confidence score
-print("Class:", class_name[2:], end="")
-print("Confidence Score:", confidence_score)
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
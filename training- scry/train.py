@@ -1,86 +1,446 @@
+"""Trains the personality CNN.
+
+Two input pipelines are available:
+
+  generator  the original ImageDataGenerator.flow_from_directory path, which
+             re-reads and re-decodes every image on every epoch;
+  tfdata     decodes and resizes the dataset once into memory-mapped uint8
+             shards (keyed by source path, mtime and size, so only changed
+             shards are rebuilt and unused ones are deleted), then feeds
+             batches through tf.data with vectorized augmentation, parallel
+             map and prefetch.
+
+Both pipelines resize to 224x224 with nearest-neighbour, rescale to [0, 1] and
+hold out the first 20% of each class folder for validation, like
+flow_from_directory does.
+
+    python train.py --dataset "D:/Sem 7 project/Datasets/scry dataset/augmented train"
+    python train.py --compare --compare-epochs 2     # timing report only
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras import layers, models
-import os
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "Backend"))
+from preprocessing import open_image
 
 dataset_path = r"D:\Sem 7 project\Datasets\scry dataset\augmented train"
 
-# Image Data Loading and Preprocessing 
+# Image Data Loading and Preprocessing
 img_size = (224, 224)
-batch_size = 16  
-datagen = ImageDataGenerator(
-    rescale=1./255,
-    validation_split=0.2,
-    rotation_range=10,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.1,
-    zoom_range=0.1,
-    horizontal_flip=True
-)
-
-train_data = datagen.flow_from_directory(
-    dataset_path,
-    target_size=img_size,
-    batch_size=batch_size,
-    subset='training'
-)
-
-val_data = datagen.flow_from_directory(
-    dataset_path,
-    target_size=img_size,
-    batch_size=batch_size,
-    subset='validation'
-)
+batch_size = 16
+validation_split = 0.2
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+SHARD_SIZE = 512  # average images per shard
+SHARD_VERSION = "2"  # bump when decode_for_training changes
+
+
+# --- Original pipeline ---
+def generator_pipeline(path, batch_size):
+    datagen = ImageDataGenerator(
+        rescale=1./255,
+        validation_split=validation_split,
+        rotation_range=10,
+        width_shift_range=0.1,
+        height_shift_range=0.1,
+        shear_range=0.1,
+        zoom_range=0.1,
+        horizontal_flip=True
+    )
+
+    train_data = datagen.flow_from_directory(
+        path,
+        target_size=img_size,
+        batch_size=batch_size,
+        subset='training'
+    )
+
+    val_data = datagen.flow_from_directory(
+        path,
+        target_size=img_size,
+        batch_size=batch_size,
+        subset='validation'
+    )
+    return train_data, val_data, train_data.num_classes
+
+
+# --- tf.data pipeline ---
+def list_split(path):
+    """Lists (file, class_index) pairs split per class the way flow_from_directory does."""
+    classes = sorted(e.name for e in os.scandir(path) if e.is_dir())
+    train, val = [], []
+    for index, name in enumerate(classes):
+        folder = os.path.join(path, name)
+        files = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        cut = int(validation_split * len(files))
+        val.extend((f, index) for f in files[:cut])
+        train.extend((f, index) for f in files[cut:])
+    return classes, train, val
+
+
+def decode_for_training(path):
+    """Decodes one image to uint8 (224, 224, 3), matching load_img(target_size=...)."""
+    try:
+        # Full-size decode (no JPEG draft), then nearest resize, as load_img does.
+        image = open_image(path, img_size, draft=False).convert("RGB")
+        return np.asarray(image.resize(img_size, Image.Resampling.NEAREST))
+    except Exception as e:
+        print(f"Warning: could not decode {path}: {e}")
+        return np.zeros((*img_size[::-1], 3), dtype=np.uint8)
+
+
+def is_shard_boundary(path):
+    """True if a new shard starts at ``path``.
+
+    Decided by the file name alone (about one name in SHARD_SIZE qualifies),
+    so adding or removing a file only changes the shard that contains it;
+    fixed-size windows would shift, and rebuild, every later shard.
+    """
+    name = os.path.basename(path).encode()
+    return int.from_bytes(hashlib.sha1(name).digest()[:4], "big") % SHARD_SIZE == 0
+
+
+def split_shards(entries):
+    """Splits ``entries`` into runs of one class, cut at ``is_shard_boundary``."""
+    chunks = []
+    for path, label in entries:
+        if not chunks or chunks[-1][-1][1] != label or is_shard_boundary(path):
+            chunks.append([])
+        chunks[-1].append((path, label))
+    return chunks
+
+
+class ShardStore:
+    """Decoded images in memory-mapped .npy shards under ``cache_dir``.
+
+    Shards never mix classes and end at content-defined boundaries (see
+    is_shard_boundary). Each is named by a hash of its paths, mtimes and
+    sizes, so a shard is rebuilt only when one of its own files is added,
+    removed or changed. ``paths`` lists the shard files in use; see
+    prune_shards.
+    """
+
+    def __init__(self, cache_dir, entries, num_classes, workers=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.labels = np.eye(num_classes, dtype=np.float32)[[label for _, label in entries]]
+        self.shards = []
+        self.offsets = []
+        self.paths = set()
+        offset = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk in split_shards(entries):
+                shard_path = os.path.join(cache_dir, f"shard-{self._key(chunk)}.npy")
+                self.shards.append(self._load_or_build(shard_path, chunk, pool))
+                self.paths.add(shard_path)
+                self.offsets.append(offset)
+                offset += len(chunk)
+        self.offsets = np.array(self.offsets)
+
+    @staticmethod
+    def _key(chunk):
+        digest = hashlib.sha1(f"v{SHARD_VERSION}|{img_size}\n".encode())
+        for path, label in chunk:
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{label}\n".encode())
+        return digest.hexdigest()
+
+    def _load_or_build(self, shard_path, chunk, pool):
+        if os.path.exists(shard_path):
+            return np.load(shard_path, mmap_mode="r")
+
+        tmp_path = shard_path + ".tmp"
+        shard = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.uint8, shape=(len(chunk), *img_size[::-1], 3)
+        )
+        paths = [path for path, _ in chunk]
+        for i, array in enumerate(pool.map(decode_for_training, paths, chunksize=16)):
+            shard[i] = array
+        shard.flush()
+        del shard
+        os.replace(tmp_path, shard_path)
+        print(f"Cached {len(chunk)} images in {shard_path}")
+        return np.load(shard_path, mmap_mode="r")
+
+    def __len__(self):
+        return len(self.labels)
+
+    def gather(self, indices):
+        """Returns (uint8 images, one-hot labels) for a batch of global indices."""
+        indices = np.sort(indices)  # sequential reads within each shard
+        images = np.empty((len(indices), *img_size[::-1], 3), dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[mask] = self.shards[shard_id][indices[mask] - self.offsets[shard_id]]
+        return images, self.labels[indices]
+
+
+def prune_shards(cache_dir, keep):
+    """Deletes shard files (and leftover .tmp files) not in ``keep``."""
+    removed = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith("shard-") and path not in keep:
+            os.remove(path)
+            removed += 1
+    if removed:
+        print(f"Removed {removed} unused shard files from {cache_dir}")
+
+
+def random_affine(images):
+    """Applies ImageDataGenerator's augmentations to a whole batch in one op.
+
+    Rotation (+/-10 deg), width/height shift (10%), shear (0.1 deg, as
+    ImageDataGenerator interprets shear_range), zoom (0.9-1.1 per axis) and
+    horizontal flip are composed into one projective transform per image.
+    """
+    batch = tf.shape(images)[0]
+    height = tf.cast(tf.shape(images)[1], tf.float32)
+    width = tf.cast(tf.shape(images)[2], tf.float32)
+
+    theta = tf.random.uniform([batch], -10.0, 10.0) * (math.pi / 180)
+    shear = tf.random.uniform([batch], -0.1, 0.1) * (math.pi / 180)
+    zoom_x = tf.random.uniform([batch], 0.9, 1.1)
+    zoom_y = tf.random.uniform([batch], 0.9, 1.1)
+    shift_x = tf.random.uniform([batch], -0.1, 0.1) * width
+    shift_y = tf.random.uniform([batch], -0.1, 0.1) * height
+    flip = tf.where(tf.random.uniform([batch]) < 0.5, -1.0, 1.0)
+
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    # A = rotation @ shear @ diag(zoom_x * flip, zoom_y): maps output to input coordinates
+    a00 = cos * zoom_x * flip
+    a01 = (-cos * tf.sin(shear) - sin * tf.cos(shear)) * zoom_y
+    a10 = sin * zoom_x * flip
+    a11 = (-sin * tf.sin(shear) + cos * tf.cos(shear)) * zoom_y
+
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    a02 = cx + shift_x - a00 * cx - a01 * cy
+    a12 = cy + shift_y - a10 * cx - a11 * cy
+    zeros = tf.zeros([batch])
+    transforms = tf.stack([a00, a01, a02, a10, a11, a12, zeros, zeros], axis=1)
+
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=tf.shape(images)[1:3],
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        fill_mode="NEAREST",
+    )
+
+
+def make_dataset(store, batch_size, training):
+    num_classes = store.labels.shape[1]
+
+    def load(indices):
+        images, labels = tf.numpy_function(store.gather, [indices], [tf.uint8, tf.float32])
+        images.set_shape([None, *img_size[::-1], 3])
+        labels.set_shape([None, num_classes])
+        return images, labels
+
+    def prepare(images, labels):
+        images = tf.cast(images, tf.float32)
+        if training:
+            images = random_affine(images)
+        return images * (1. / 255), labels
+
+    ds = tf.data.Dataset.range(len(store))
+    if training:
+        ds = ds.shuffle(len(store), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.map(prepare, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def tfdata_pipeline(path, batch_size, cache_dir, workers=None):
+    classes, train_entries, val_entries = list_split(path)
+    print(f"Found {len(train_entries)} training and {len(val_entries)} validation images "
+          f"in {len(classes)} classes.")
+    train_store = ShardStore(cache_dir, train_entries, len(classes), workers)
+    val_store = ShardStore(cache_dir, val_entries, len(classes), workers)
+    prune_shards(cache_dir, train_store.paths | val_store.paths)
+    return (make_dataset(train_store, batch_size, training=True),
+            make_dataset(val_store, batch_size, training=False),
+            len(classes))
+
 
 # Building Model
-model = models.Sequential([
-    layers.Conv2D(32, (3,3), activation='relu', input_shape=(*img_size, 3)),
-    layers.MaxPooling2D(2,2),
-
-    layers.Conv2D(64, (3,3), activation='relu'),
-    layers.MaxPooling2D(2,2),
-
-    layers.Conv2D(128, (3,3), activation='relu'),
-    layers.MaxPooling2D(2,2),
-
-    layers.Flatten(),
-    layers.Dense(128, activation='relu'),
-    layers.Dropout(0.5),
-    layers.Dense(5, activation='softmax')  # 5 classes
-])
-
-# Compiling
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=0.001), 
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
-
-# Training
-history = model.fit(
-    train_data,
-    validation_data=val_data,
-    epochs=50 
-)
-
-# Unfreeze the top layers for fine-tuning
-base_model.trainable = True
-
-# Recompile with a lower learning rate
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=1e-5),
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
-
-# Train again for a few more epochs
-fine_tune_history = model.fit(
-    train_data,
-    validation_data=val_data,
-    epochs=20
-)
-
-model.save("personality_model.h5")
-
-print(" Model training complete and saved as 'personality_model.h5'")
+def build_model(num_classes=5):
+    return models.Sequential([
+        layers.Conv2D(32, (3,3), activation='relu', input_shape=(*img_size, 3)),
+        layers.MaxPooling2D(2,2),
+
+        layers.Conv2D(64, (3,3), activation='relu'),
+        layers.MaxPooling2D(2,2),
+
+        layers.Conv2D(128, (3,3), activation='relu'),
+        layers.MaxPooling2D(2,2),
+
+        layers.Flatten(),
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(num_classes, activation='softmax')  # 5 classes
+    ])
+
+
+def compile_model(model, learning_rate):
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+
+
+# --- Timing ---
+class EpochTimer(tf.keras.callbacks.Callback):
+    def __init__(self):
+        super().__init__()
+        self.epoch_seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_seconds.append(time.perf_counter() - self._start)
+
+
+def compute_seconds_per_step(model, train_data, steps=20):
+    """Times train steps on one batch that is already in memory (no input cost)."""
+    x, y = next(iter(train_data))
+    probe = tf.keras.models.clone_model(model)
+    compile_model(probe, 1e-5)
+    probe.train_on_batch(x, y)  # trace
+    start = time.perf_counter()
+    for _ in range(steps):
+        probe.train_on_batch(x, y)
+    return (time.perf_counter() - start) / steps
+
+
+def timing_summary(name, timer, model, train_data, steps_per_epoch):
+    # Skip the first epoch when possible: it includes tracing and, for
+    # tfdata, building the shard cache.
+    epochs = timer.epoch_seconds[1:] or timer.epoch_seconds
+    epoch_seconds = float(np.mean(epochs))
+    compute = compute_seconds_per_step(model, train_data) * steps_per_epoch
+    return {
+        "pipeline": name,
+        "steps_per_epoch": steps_per_epoch,
+        "epoch_seconds": epoch_seconds,
+        "epochs_per_hour": 3600.0 / epoch_seconds,
+        "compute_seconds_per_epoch": compute,
+        "input_bound_fraction": max(0.0, 1.0 - compute / epoch_seconds),
+    }
+
+
+def print_timing(rows):
+    print(f"\n{'pipeline':<10}{'epoch s':>10}{'epochs/h':>10}{'compute s':>11}{'input-bound':>13}")
+    for r in rows:
+        print(f"{r['pipeline']:<10}{r['epoch_seconds']:>10.1f}{r['epochs_per_hour']:>10.1f}"
+              f"{r['compute_seconds_per_epoch']:>11.1f}{r['input_bound_fraction']:>12.0%}")
+
+
+def load_pipeline(args, name):
+    if name == "generator":
+        train_data, val_data, num_classes = generator_pipeline(args.dataset, args.batch_size)
+        return train_data, val_data, num_classes, len(train_data)
+    train_data, val_data, num_classes = tfdata_pipeline(
+        args.dataset, args.batch_size, args.cache_dir, args.workers
+    )
+    return train_data, val_data, num_classes, int(train_data.cardinality())
+
+
+def compare(args):
+    rows = []
+    for name in ("generator", "tfdata"):
+        train_data, val_data, num_classes, steps = load_pipeline(args, name)
+        model = build_model(num_classes)
+        compile_model(model, 0.001)
+        timer = EpochTimer()
+        model.fit(train_data, epochs=args.compare_epochs, callbacks=[timer])
+        rows.append(timing_summary(name, timer, model, train_data, steps))
+    print_timing(rows)
+    return rows
+
+
+def train(args):
+    train_data, val_data, num_classes, steps = load_pipeline(args, args.pipeline)
+
+    model = build_model(num_classes)
+
+    # Compiling
+    compile_model(model, 0.001)
+
+    # Training
+    timer = EpochTimer()
+    history = model.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=args.epochs,
+        callbacks=[timer]
+    )
+
+    # Fine-tuning. The network is trained from scratch, so there is no frozen
+    # base to unfreeze; the second stage keeps every layer trainable and
+    # continues at a lower learning rate.
+    model.trainable = True
+
+    # Recompile with a lower learning rate
+    compile_model(model, 1e-5)
+
+    # Train again for a few more epochs
+    fine_tune_history = model.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=args.fine_tune_epochs,
+        callbacks=[timer]
+    )
+
+    model.save(args.output)
+
+    print(f" Model training complete and saved as '{args.output}'")
+    return [timing_summary(args.pipeline, timer, model, train_data, steps)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the personality model.")
+    parser.add_argument("--dataset", default=dataset_path)
+    parser.add_argument("--pipeline", choices=["generator", "tfdata"], default="tfdata")
+    parser.add_argument("--cache-dir", default=os.path.join(HERE, ".shard_cache"),
+                        help="where tfdata keeps its decoded shards (unused shards there are deleted)")
+    parser.add_argument("--workers", type=int, default=None, help="decode processes for shard building")
+    parser.add_argument("--batch-size", type=int, default=batch_size)
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--fine-tune-epochs", type=int, default=20)
+    parser.add_argument("--output", default="personality_model.h5")
+    parser.add_argument("--compare", action="store_true",
+                        help="only time both pipelines for --compare-epochs and print the report")
+    parser.add_argument("--compare-epochs", type=int, default=3)
+    parser.add_argument("--timing-report", help="write the timing report as JSON to this path")
+    args = parser.parse_args()
+
+    rows = compare(args) if args.compare else train(args)
+    if not args.compare:
+        print_timing(rows)
+    if args.timing_report:
+        with open(args.timing_report, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()